@@ -1,39 +1,119 @@
 from docling.document_converter import DocumentConverter
-from utils.sitemap import get_sitemap_urls
+from utils.cache import ConversionCache
+from utils.crawl_state import CrawlState, fetch_changed
+from utils.parallel import convert_parallel, convert_sharded
+from utils.profiles import AdaptiveConverter
+from utils.serialization import dump_document, load_document
+from utils.sitemap import get_sitemap_urls, iter_sitemap_entries
 
-converter = DocumentConverter()
+PDF_URL = "https://arxiv.org/pdf/2408.09869"
+SITE_URL = "https://ds4sd.github.io/docling/"
 
-# --------------------------------------------------------------
-# Basic PDF extraction
-# --------------------------------------------------------------
 
-result = converter.convert("https://arxiv.org/pdf/2408.09869")
+def main():
+    converter = DocumentConverter()
+    cache = ConversionCache(converter)  # Reuses conversions of unchanged sources
 
-document = result.document
-markdown_output = document.export_to_markdown()
-json_output = document.export_to_dict()
+    # --------------------------------------------------------------
+    # Basic PDF extraction
+    # --------------------------------------------------------------
 
-print(markdown_output)
+    document = cache.convert(PDF_URL)
 
-# --------------------------------------------------------------
-# Basic HTML extraction
-# --------------------------------------------------------------
+    markdown_output = document.export_to_markdown()
+    json_output = document.export_to_dict()
 
-result = converter.convert("https://ds4sd.github.io/docling/")
+    # zlib-compressed JSON for storing converted documents, loaded back in a
+    # single parse-and-validate pass
+    stored_output = dump_document(document)
+    document = load_document(stored_output)
 
-document = result.document
-markdown_output = document.export_to_markdown()
-print(markdown_output)
+    print(markdown_output)
 
-# --------------------------------------------------------------
-# Scrape multiple pages using the sitemap
-# --------------------------------------------------------------
+    # --------------------------------------------------------------
+    # Basic HTML extraction
+    # --------------------------------------------------------------
 
-sitemap_urls = get_sitemap_urls("https://ds4sd.github.io/docling/")
-conv_results_iter = converter.convert_all(sitemap_urls)
+    document = cache.convert(SITE_URL)
 
-docs = []
-for result in conv_results_iter:
-    if result.document:
-        document = result.document
-        docs.append(document)
+    markdown_output = document.export_to_markdown()
+    print(markdown_output)
+
+    # --------------------------------------------------------------
+    # Scrape multiple pages using the sitemap
+    # --------------------------------------------------------------
+
+    sitemap_urls = get_sitemap_urls(SITE_URL)
+    conv_results_iter = converter.convert_all(sitemap_urls)
+
+    docs = []
+    for result in conv_results_iter:
+        if result.document:
+            document = result.document
+            docs.append(document)
+
+    # --------------------------------------------------------------
+    # Refresh only the sitemap pages that changed since the last run
+    # --------------------------------------------------------------
+
+    # Stores the lastmod, ETag and Last-Modified of every converted page
+    crawl_state = CrawlState()
+
+    # Pages with an unchanged lastmod are skipped, the rest use a conditional GET
+    changed_docs = []
+    entries = iter_sitemap_entries(SITE_URL)
+    for version, stream in fetch_changed(entries, crawl_state):
+        try:
+            changed_docs.append(converter.convert(stream).document)
+        except Exception as e:
+            # Recorded and retried on the next crawl; the other pages go on
+            crawl_state.record_failure(version.url, f"{type(e).__name__}: {str(e)}")
+            continue
+        crawl_state.save(version)  # Only once converted, so failures are retried
+
+    print(crawl_state.report())
+    for url, error in crawl_state.failures().items():
+        print(f"Failed {url}: {error}")
+
+    # --------------------------------------------------------------
+    # Convert the sitemap pages in parallel
+    # --------------------------------------------------------------
+
+    docs = []
+    failed = []
+    # adaptive=True skips OCR and table models for born-digital pages
+    outcomes = convert_parallel(sitemap_urls, max_workers=8, timeout=120, adaptive=True)
+    for outcome in outcomes:
+        if outcome.ok:
+            docs.append(outcome.document)
+        else:
+            failed.append(outcome)
+            print(f"Failed {outcome.source}: {outcome.error}")
+
+    print(f"Converted {len(docs)} pages, {len(failed)} failed")
+    print(cache.report())
+
+    # --------------------------------------------------------------
+    # Pick a pipeline profile per document
+    # --------------------------------------------------------------
+
+    # Inputs with a text layer and few images skip OCR and the table-structure model
+    adaptive_converter = AdaptiveConverter()
+    result, profile = adaptive_converter.convert_with_profile(PDF_URL)
+    print(f"Converted with the {profile.name} profile: {profile.reason}")
+    print(adaptive_converter.report())
+
+    # --------------------------------------------------------------
+    # Convert a large PDF in parallel page-range shards
+    # --------------------------------------------------------------
+
+    # Each shard of 8 pages is converted by a separate worker and the results are
+    # stitched back together with the original page numbers
+    document = convert_sharded(PDF_URL, pages_per_shard=8)
+    print(f"Converted {len(document.pages)} pages")
+
+
+# Worker processes re-import this file on platforms that spawn (macOS, Windows),
+# so all work happens in main()
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,8 @@ from docling.chunking import HybridChunker
 from docling.document_converter import DocumentConverter
 from dotenv import load_dotenv
 from openai import OpenAI
-from utils.tokenizer import OpenAITokenizerWrapper
+from utils.cache import ConversionCache
+from utils.tiktoken_tokenizer import TiktokenTokenizer
 
 load_dotenv()
 
@@ -10,8 +11,9 @@ load_dotenv()
 client = OpenAI()
 
 
-tokenizer = OpenAITokenizerWrapper()  # Load our custom tokenizer for OpenAI
 MAX_TOKENS = 8191  # text-embedding-3-large's maximum context length
+# tiktoken adapter for the chunker with integer, memoized token counts
+tokenizer = TiktokenTokenizer(encoding_name="cl100k_base", max_tokens=MAX_TOKENS)
 
 
 # --------------------------------------------------------------
@@ -19,7 +21,9 @@ MAX_TOKENS = 8191  # text-embedding-3-large's maximum context length
 # --------------------------------------------------------------
 
 converter = DocumentConverter()
-result = converter.convert("https://arxiv.org/pdf/2408.09869")
+cache = ConversionCache(converter)  # Skips re-conversion when the PDF is unchanged
+document = cache.convert("https://arxiv.org/pdf/2408.09869")
+print(cache.report())
 
 
 # --------------------------------------------------------------
@@ -27,12 +31,11 @@ result = converter.convert("https://arxiv.org/pdf/2408.09869")
 # --------------------------------------------------------------
 
 chunker = HybridChunker(
-    tokenizer=tokenizer,
-    max_tokens=MAX_TOKENS,
+    tokenizer=tokenizer,  # Also sets the maximum number of tokens per chunk
     merge_peers=True,
 )
 
-chunk_iter = chunker.chunk(dl_doc=result.document)
+chunk_iter = chunker.chunk(dl_doc=document)
 chunks = list(chunk_iter)
 
 len(chunks)
@@ -1,45 +1,59 @@
+import os
 from typing import List
 
 import lancedb
+import pyarrow as pa
 from docling.chunking import HybridChunker
 from docling.document_converter import DocumentConverter
 from dotenv import load_dotenv
-from lancedb.embeddings import get_registry
 from lancedb.pydantic import LanceModel, Vector
 from openai import OpenAI
-from utils.tokenizer import OpenAITokenizerWrapper
+from utils.cache import ConversionCache
+from utils.dedup import NearDuplicateFilter
+from utils.embeddings import (
+    EmbeddingBatcher,
+    create_embedding_function,
+    get_embedding_cache,
+    table_name,
+)
+from utils.ingest import (
+    IngestReport,
+    chunk_records,
+    create_chunk_table,
+    document_hash,
+    remove_missing,
+    sync_document,
+)
+from utils.indexes import (
+    create_fts_index,
+    create_scalar_indexes,
+    create_vector_index,
+)
+from utils.journal import IngestJournal
+from utils.tiktoken_tokenizer import TiktokenTokenizer
 
 load_dotenv()
 
-# Initialize OpenAI client (make sure you have OPENAI_API_KEY in your environment variables)
-client = OpenAI()
-
-
-tokenizer = OpenAITokenizerWrapper()  # Load our custom tokenizer for OpenAI
 MAX_TOKENS = 8191  # text-embedding-3-large's maximum context length
+# tiktoken adapter for the chunker with integer, memoized token counts
+tokenizer = TiktokenTokenizer(encoding_name="cl100k_base", max_tokens=MAX_TOKENS)
 
 
 # --------------------------------------------------------------
-# Extract the data
+# Set up conversion and chunking
 # --------------------------------------------------------------
 
-converter = DocumentConverter()
-result = converter.convert("https://arxiv.org/pdf/2408.09869")
+# Every document in the corpus, identified by its source URL
+SOURCES = ["https://arxiv.org/pdf/2408.09869"]
 
-
-# --------------------------------------------------------------
-# Apply hybrid chunking
-# --------------------------------------------------------------
+converter = DocumentConverter()
+cache = ConversionCache(converter)  # Skips re-conversion when the PDF is unchanged
 
 chunker = HybridChunker(
-    tokenizer=tokenizer,
-    max_tokens=MAX_TOKENS,
+    tokenizer=tokenizer,  # Also sets the maximum number of tokens per chunk
     merge_peers=True,
 )
 
-chunk_iter = chunker.chunk(dl_doc=result.document)
-chunks = list(chunk_iter)
-
 # --------------------------------------------------------------
 # Create a LanceDB database and table
 # --------------------------------------------------------------
@@ -48,8 +62,18 @@ chunks = list(chunk_iter)
 db = lancedb.connect("data/lancedb")
 
 
-# Get the OpenAI embedding function
-func = get_registry().get("openai").create(name="text-embedding-3-large")
+# Get the embedding function. "openai" is fronted by a local cache of embeddings
+# keyed by model, dimensions and text hash; "local" and "hashing" run on our own
+# CPU without network access. The schema and search code work with any of them.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+
+# text-embedding-3 vectors can be shortened to 256, 512 or 1024 dimensions and
+# stored as float16: several times less storage and faster search for a small
+# recall loss (measure it on your data with benchmarks/embedding_storage.py)
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", 0)) or None
+EMBEDDING_FLOAT16 = bool(os.getenv("EMBEDDING_FLOAT16"))
+VECTOR_TYPE = pa.float16() if EMBEDDING_FLOAT16 else pa.float32()
+func = create_embedding_function(EMBEDDING_BACKEND, dimensions=EMBEDDING_DIMENSIONS)
 
 
 # Define a simplified metadata schema
@@ -67,44 +91,137 @@ class ChunkMetadata(LanceModel):
 # Define the main Schema
 class Chunks(LanceModel):
     text: str = func.SourceField()
-    vector: Vector(func.ndims()) = func.VectorField()  # type: ignore
+    vector: Vector(func.ndims(), value_type=VECTOR_TYPE) = func.VectorField()  # type: ignore
     metadata: ChunkMetadata
-
-
-table = db.create_table("docling", schema=Chunks, mode="overwrite")
-
-# --------------------------------------------------------------
-# Prepare the chunks for the table
-# --------------------------------------------------------------
-
-# Create table with processed chunks
-processed_chunks = [
-    {
-        "text": chunk.text,
-        "metadata": {
-            "filename": chunk.meta.origin.filename,
-            "page_numbers": [
-                page_no
-                for page_no in sorted(
-                    set(
-                        prov.page_no
-                        for item in chunk.meta.doc_items
-                        for prov in item.prov
-                    )
-                )
-            ]
-            or None,
-            "title": chunk.meta.headings[0] if chunk.meta.headings else None,
-        },
-    }
-    for chunk in chunks
-]
+    # Metadata promoted to top-level columns for scalar indexes and prefilters
+    filename: str | None
+    page_numbers: List[int] | None
+    title: str | None
+    doc_id: str  # Source URL of the document
+    doc_hash: str  # Content hash of the document version the chunk came from
+    chunk_hash: str  # Content hash of the chunk text and metadata
+
+
+# Keep the existing table so unchanged chunks are not embedded again. Every set
+# of embedding settings gets its own table ("docling" for the defaults), so
+# search and chat find it with `table_name_from_env()`
+TABLE_NAME = table_name(EMBEDDING_BACKEND, EMBEDDING_DIMENSIONS, EMBEDDING_FLOAT16)
+try:
+    table = create_chunk_table(db, TABLE_NAME, Chunks)
+except ValueError as e:
+    raise SystemExit(
+        f"{e}. It was built by an earlier version of this tutorial: delete "
+        f"data/lancedb/{TABLE_NAME}.lance and run again (OpenAI embeddings "
+        "are reused from data/embedding_cache.sqlite)."
+    )
 
 # --------------------------------------------------------------
-# Add the chunks to the table (automatically embeds the text)
+# Sync the chunks of every document (only new chunks are embedded)
 # --------------------------------------------------------------
 
-table.add(processed_chunks)
+# Chunks are streamed from the chunker into the table in batches of this size,
+# so memory stays flat and rows appear while the document is still being chunked
+BATCH_SIZE = 256
+
+# Embed new chunks ourselves: token-budgeted requests, several in flight at once,
+# retried with backoff. Rows that already have a vector are not embedded again
+# by the table's embedding function.
+# Local backends embed on table.add instead, batched on the CPU.
+if EMBEDDING_BACKEND == "openai":
+    # Initialize OpenAI client (make sure you have OPENAI_API_KEY in your environment variables)
+    client = OpenAI()
+    embedding_cache = get_embedding_cache(func.cache_path)
+    batcher = EmbeddingBatcher(
+        client=client,
+        model=func.name,
+        tokenizer=tokenizer,
+        max_tokens_per_text=MAX_TOKENS,
+        max_concurrency=4,
+        cache=embedding_cache,
+        dimensions=EMBEDDING_DIMENSIONS,
+    )
+
+# Drop chunks that are near-identical to a chunk already in the table or seen
+# earlier in the run (navigation, footers, versioned copies of a page) before
+# they are embedded. The table is only read once a document needs syncing.
+dedup = NearDuplicateFilter(threshold=0.9)
+dedup.seed(table)
+
+
+def embed(rows):
+    """Embed rows with the batcher; local backends embed on table.add instead."""
+    if EMBEDDING_BACKEND == "openai":
+        # Requests of at most BATCH_SIZE chunks, yielded as each one completes
+        rows = batcher.embed_records(rows, batch_size=BATCH_SIZE)
+    return rows
+
+
+def prepare(rows):
+    """Deduplicate and embed the new chunks of a document."""
+    return embed(dedup.filter(rows))
+
+
+# Record progress in a durable journal: if the run is interrupted, starting it
+# again resumes the job, skipping sources that were already written. Rows
+# committed for a partially written source are kept in the table and not redone.
+journal = IngestJournal("data/ingest_journal.sqlite", job_id=TABLE_NAME)
+if journal.resumed:
+    print("Resuming unfinished ingestion job")
+
+report = IngestReport()
+skipped = 0
+for source in SOURCES:
+    if journal.is_written(source):
+        skipped += 1
+        continue
+
+    document = cache.convert(source)
+    report += sync_document(
+        table,
+        doc_id=source,
+        doc_hash=document_hash(document),
+        records=chunk_records(chunker.chunk(dl_doc=document)),  # Lazy
+        batch_size=BATCH_SIZE,
+        prepare=prepare,
+    )
+    # Keep the source URL of every dropped duplicate before the source counts as
+    # written, so a resumed run can still re-admit them later
+    dedup.save_provenance(db)
+    journal.mark_written(source)
+
+# Drop documents that are no longer part of the corpus
+report += remove_missing(table, SOURCES)
+
+# Add back dropped duplicates whose kept copy was deleted by this run
+report += IngestReport(added=dedup.readmit(db, table, SOURCES, prepare=embed))
+
+# Add the rows written by this run to the existing indexes (and compact the
+# small fragments left by batched writes) instead of rebuilding every index
+table.optimize()
+
+# Index the metadata columns used by filtered search and incremental ingest
+# (only indexes that do not exist yet are built)
+create_scalar_indexes(table)
+
+# Index the chunk text for the lexical half of hybrid search (built once)
+create_fts_index(table)
+
+# Build an approximate nearest neighbour index once the table is large enough
+# for brute-force search to get slow; later runs only optimize it (pick query
+# settings with benchmarks/index_sweep.py, see the README)
+if create_vector_index(table, index_type="IVF_PQ"):
+    print("Built the IVF_PQ vector index")
+
+journal.finish()
+
+print(cache.report())
+if EMBEDDING_BACKEND == "openai":
+    print(embedding_cache.report())
+    print(batcher.report())
+print(dedup.report())
+print(f"Chunks: {report}")
+if skipped:
+    print(f"Skipped {skipped} sources written before the restart")
 
 # --------------------------------------------------------------
 # Load the table
@@ -1,4 +1,18 @@
+import time
+
 import lancedb
+import utils.embeddings  # noqa: F401 (registers the cached embedding function)
+from dotenv import load_dotenv
+from utils.embeddings import get_query_cache, table_name_from_env
+from utils.search import (
+    batch_search,
+    embed_query,
+    hybrid_search,
+    reciprocal_rank_fusion,
+    search,
+)
+
+load_dotenv()
 
 # --------------------------------------------------------------
 # Connect to the database
@@ -12,12 +26,96 @@ db = lancedb.connect(uri)
 # Load the table
 # --------------------------------------------------------------
 
-table = db.open_table("docling")
+# The table 3-embedding.py built for the embedding settings in the environment
+table = db.open_table(table_name_from_env())
 
 
 # --------------------------------------------------------------
 # Search the table
 # --------------------------------------------------------------
 
-result = table.search(query="what's docling?", query_type="vector").limit(3)
+# The query is embedded with the table's embedding function; repeated queries
+# are answered from the query embedding cache instead of the API
+query_vector = embed_query(table, "what's docling?")
+result = table.search(query_vector, query_type="vector").limit(3)
 result.to_pandas()
+
+
+# --------------------------------------------------------------
+# Cache query embeddings
+# --------------------------------------------------------------
+
+# Queries are cached by model and normalized text (case and whitespace do not
+# matter), in memory and in data/embedding_cache.sqlite across restarts
+for query in ["What is Docling?", "what is docling?", "  WHAT IS DOCLING?  "]:
+    start = time.perf_counter()
+    embed_query(table, query)
+    print(f"{query!r}: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+print(get_query_cache().report())
+
+
+# --------------------------------------------------------------
+# Search within one document or section
+# --------------------------------------------------------------
+
+# The filter is applied before the vector search, using the scalar indexes
+result = search(table, "what's docling?", limit=3, filename="2408.09869.pdf")
+result
+
+result = search(table, "table structure recognition", limit=3, pages=[4, 5])
+result
+
+
+# --------------------------------------------------------------
+# Tune the vector index at query time
+# --------------------------------------------------------------
+
+# With an IVF_PQ index: search more partitions and re-rank 10x the candidates
+# with the full vectors for higher recall, at some extra latency
+result = search(table, "what's docling?", limit=3, nprobes=20, refine_factor=10)
+result
+
+# Exact nearest neighbours, skipping the index
+result = search(table, "what's docling?", limit=3, exact=True)
+result
+
+
+# --------------------------------------------------------------
+# Hybrid search (full-text + vector, fused by rank)
+# --------------------------------------------------------------
+
+# Exact terms such as identifiers and section numbers are found by the
+# full-text index, paraphrases by the vector search
+result = hybrid_search(table, "DocLayNet layout model", limit=3)
+result[["text", "vector_rank", "fts_rank", "_relevance_score"]]
+
+# Milliseconds spent in each retriever (they run concurrently)
+result.attrs["latency_ms"]
+
+
+# --------------------------------------------------------------
+# Search many queries at once
+# --------------------------------------------------------------
+
+# Evaluation sets and sub-queries fanned out from one question are embedded in
+# one request and searched in a single pass over the table
+queries = [
+    "what's docling?",
+    "Which OCR engine does docling use?",
+    "How does docling recognize table structure?",
+]
+results = batch_search(table, queries, limit=3)
+for query, result in zip(queries, results):
+    print(query, result["text"].str[:80].tolist())
+
+# Fan-out: fuse the rankings of the sub-queries into a single result list
+rows = {
+    (row["doc_id"], row["chunk_hash"]): row
+    for result in results
+    for row in result.to_dict("records")
+}
+fused = reciprocal_rank_fusion(
+    [list(zip(result["doc_id"], result["chunk_hash"])) for result in results]
+)
+[rows[key]["text"][:80] for key, _ in fused[:5]]
@@ -1,7 +1,10 @@
 import streamlit as st
 import lancedb
+import utils.embeddings  # noqa: F401 (registers the cached embedding function)
 from openai import OpenAI
 from dotenv import load_dotenv
+from utils.embeddings import table_name_from_env
+from utils.search import search
 
 # Load environment variables
 load_dotenv()
@@ -19,21 +22,38 @@ def init_db():
         LanceDB table object
     """
     db = lancedb.connect("data/lancedb")
-    return db.open_table("docling")
+    return db.open_table(table_name_from_env())
 
 
-def get_context(query: str, table, num_results: int = 5) -> str:
+@st.cache_data(ttl=300)
+def list_filenames(_table) -> list[str]:
+    """List the files in the database, for the document filter.
+
+    Args:
+        _table: LanceDB table object (not hashed by the cache)
+
+    Returns:
+        list[str]: Sorted distinct filenames
+    """
+    rows = _table.search().select(["filename"]).limit(None).to_arrow()
+    return sorted({name for name in rows["filename"].to_pylist() if name})
+
+
+def get_context(
+    query: str, table, num_results: int = 5, filename: str | None = None
+) -> str:
     """Search the database for relevant context.
 
     Args:
         query: User's question
         table: LanceDB table object
         num_results: Number of results to return
+        filename: Only search chunks from this file
 
     Returns:
         str: Concatenated context from relevant chunks with source information
     """
-    results = table.search(query).limit(num_results).to_pandas()
+    results = search(table, query, limit=num_results, filename=filename)
     contexts = []
 
     for _, row in results.iterrows():
@@ -101,6 +121,14 @@ if "messages" not in st.session_state:
 # Initialize database connection
 table = init_db()
 
+# Optionally restrict the search to one document (applied as a prefilter)
+with st.sidebar:
+    filename = st.selectbox(
+        "Search in",
+        [None, *list_filenames(table)],
+        format_func=lambda name: name or "All documents",
+    )
+
 # Display chat messages
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
@@ -117,7 +145,7 @@ if prompt := st.chat_input("Ask a question about the document"):
 
     # Get relevant context
     with st.status("Searching document...", expanded=False) as status:
-        context = get_context(prompt, table)
+        context = get_context(prompt, table, filename=filename)
         st.markdown(
             """
             <style>
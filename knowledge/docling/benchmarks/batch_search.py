@@ -0,0 +1,119 @@
+"""Wall time of retrieving an evaluation set one query at a time and in one batch.
+
+Builds an evaluation set from the ingested table (the opening words of sampled
+chunks, each expected to retrieve its own chunk) and runs it through `search`
+query by query and through `batch_search` once. Reports wall time, queries per
+second and hit rate@k of both. Run from knowledge/docling after 3-embedding.py:
+
+    python -m benchmarks.batch_search --db data/lancedb --table docling --queries 1000
+
+Each mode gets an empty in-memory query cache. The table's embedding function
+may still answer repeated runs from its own cache (data/embedding_cache.sqlite),
+so use a different --seed to include fresh embedding requests.
+"""
+
+import argparse
+import json
+import platform
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import lancedb
+import numpy as np
+import utils.embeddings  # noqa: F401 (registers the cached embedding function)
+from utils.embeddings import QueryEmbeddingCache
+from utils.search import batch_search, search
+
+
+def evaluation_set(
+    table, n: int, words: int, seed: int
+) -> List[Tuple[str, Tuple[str, str]]]:
+    """Samples chunks and pairs the opening words of each with the chunk's key."""
+    rng = np.random.default_rng(seed)
+    total = table.count_rows()
+    offsets = rng.choice(total, size=min(n, total), replace=False)
+    rows = table.take_offsets(offsets.tolist()).to_arrow().to_pylist()
+    return [
+        (" ".join(row["text"].split()[:words]), (row["doc_id"], row["chunk_hash"]))
+        for row in rows
+    ]
+
+
+def hit_rate(results, expected: List[Tuple[str, str]]) -> float:
+    """Fraction of queries that retrieved their own chunk."""
+    hits = [
+        key in set(zip(result["doc_id"], result["chunk_hash"]))
+        for result, key in zip(results, expected)
+    ]
+    return float(np.mean(hits)) if hits else 0.0
+
+
+def run(table, n_queries: int, k: int, words: int, seed: int) -> Dict[str, Any]:
+    pairs = evaluation_set(table, n_queries, words, seed)
+    queries = [query for query, _ in pairs]
+    expected = [key for _, key in pairs]
+
+    modes = {
+        "sequential": lambda cache: [
+            search(table, query, limit=k, query_cache=cache) for query in queries
+        ],
+        "batch": lambda cache: batch_search(table, queries, limit=k, query_cache=cache),
+    }
+    results = {}
+    for name, retrieve in modes.items():
+        start = time.perf_counter()
+        found = retrieve(QueryEmbeddingCache())
+        seconds = time.perf_counter() - start
+        results[name] = {
+            "seconds": seconds,
+            "queries_per_second": len(queries) / seconds if seconds else 0.0,
+            f"hit_rate@{k}": hit_rate(found, expected),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="data/lancedb")
+    parser.add_argument("--table", default="docling")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument(
+        "--words", type=int, default=12, help="Words of each chunk used as its query"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output", type=Path, default=Path("benchmarks/results/batch_search.json")
+    )
+    args = parser.parse_args()
+
+    table = lancedb.connect(args.db).open_table(args.table)
+    modes = run(table, args.queries, args.k, args.words, args.seed)
+    results = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "rows": table.count_rows(),
+        "queries": min(args.queries, table.count_rows()),
+        "k": args.k,
+        "modes": modes,
+    }
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(results, indent=2))
+
+    for name, result in modes.items():
+        print(
+            f"{name:<10} {result['seconds']:>8.2f} s  "
+            f"{result['queries_per_second']:>8,.1f} queries/s  "
+            f"hit rate@{args.k} {result[f'hit_rate@{args.k}']:.3f}"
+        )
+    speedup = modes["sequential"]["seconds"] / max(modes["batch"]["seconds"], 1e-9)
+    print(f"Batch search is {speedup:.1f}x faster")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
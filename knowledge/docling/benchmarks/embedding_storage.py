@@ -0,0 +1,200 @@
+"""Storage size, search latency and recall of shortened and float16 embeddings.
+
+Shortens the full-size vectors of the ingested table to fewer dimensions
+(truncate and re-normalize, which is what the text-embedding-3 `dimensions`
+parameter does), optionally stores them as float16, and compares every variant
+with full-size float32 vectors: bytes on disk, p50/p99 exact-search latency and
+recall@k of the baseline's nearest neighbours. Run from knowledge/docling after
+3-embedding.py with the default (full-size) embeddings:
+
+    python -m benchmarks.embedding_storage --db data/lancedb --table docling
+"""
+
+import argparse
+import json
+import platform
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import lancedb
+import numpy as np
+import pyarrow as pa
+from utils.embeddings import shorten_embeddings
+
+VALUE_TYPES = {"float32": pa.float32(), "float16": pa.float16()}
+
+
+def load_vectors(db_path: str, table_name: str) -> np.ndarray:
+    """Reads every vector of a table as a float32 matrix."""
+    table = lancedb.connect(db_path).open_table(table_name)
+    scan = table.search().select(["vector"]).limit(table.count_rows())
+    column = scan.to_arrow()["vector"]
+    return np.stack(column.to_numpy(zero_copy_only=False)).astype(np.float32)
+
+
+def create_variant(db, vectors: np.ndarray, dimensions: int, value_type: str):
+    """Writes the vectors, shortened and cast, to a table of their own."""
+    shortened = shorten_embeddings(vectors, dimensions)
+    values = shortened.astype(value_type).ravel()
+    data = pa.table(
+        {
+            "id": pa.array(np.arange(len(vectors))),
+            "vector": pa.FixedSizeListArray.from_arrays(
+                pa.array(values, type=VALUE_TYPES[value_type]), dimensions
+            ),
+        }
+    )
+    return db.create_table(f"{value_type}_{dimensions}", data=data, mode="overwrite")
+
+
+def table_bytes(path: Path) -> int:
+    """Total size of a table's files on disk."""
+    return sum(file.stat().st_size for file in path.rglob("*") if file.is_file())
+
+
+def run_queries(table, queries: Dict[str, np.ndarray], k: int) -> Dict[str, Any]:
+    """Runs exact searches and returns the ids found (without the query row
+    itself) and the latencies."""
+    ids, latencies = [], []
+    for index, vector in zip(queries["ids"], queries["vectors"]):
+        builder = table.search(vector, vector_column_name="vector").limit(k + 1)
+        builder = builder.bypass_vector_index().select(["id"])
+        start = time.perf_counter()
+        result = builder.to_arrow()
+        latencies.append((time.perf_counter() - start) * 1000)
+        found = [i for i in result["id"].to_pylist() if i != index]
+        ids.append(set(found[:k]))
+    return {
+        "ids": ids,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def recall(found: List[set], truth: List[set]) -> float:
+    """Mean fraction of the baseline's nearest neighbours that were found."""
+    return float(np.mean([len(f & t) / max(len(t), 1) for f, t in zip(found, truth)]))
+
+
+def run(
+    vectors: np.ndarray,
+    dimensions: List[Optional[int]],
+    value_types: List[str],
+    n_queries: int,
+    k: int,
+    seed: int = 0,
+) -> List[Dict[str, Any]]:
+    """Measures every (dimensions, value type) variant against full-size float32.
+
+    Args:
+        vectors: Full-size embeddings of the ingested chunks
+        dimensions: Dimensions to shorten to, None for the full size
+        value_types: Storage types, "float32" and/or "float16"
+        n_queries: Number of stored chunks used as queries
+        k: Neighbours compared per query
+        seed: Seed for sampling the query chunks
+
+    Returns:
+        One result per variant, the baseline first
+    """
+    full = vectors.shape[1]
+    rng = np.random.default_rng(seed)
+    query_ids = rng.choice(
+        len(vectors), size=min(n_queries, len(vectors)), replace=False
+    )
+
+    variants = [(full, "float32")] + [
+        (dims or full, value_type)
+        for dims in dimensions
+        for value_type in value_types
+        if (dims or full, value_type) != (full, "float32") and (dims or full) <= full
+    ]
+
+    results, baseline = [], None
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = lancedb.connect(tmp_dir)
+        for dims, value_type in variants:
+            table = create_variant(db, vectors, dims, value_type)
+            # Queries are embedded at the same size but sent as float32
+            queries = {
+                "ids": query_ids,
+                "vectors": shorten_embeddings(vectors[query_ids], dims),
+            }
+            measured = run_queries(table, queries, k)
+            if baseline is None:
+                baseline = measured["ids"]
+            size = table_bytes(Path(tmp_dir) / f"{table.name}.lance")
+            results.append(
+                {
+                    "dimensions": dims,
+                    "value_type": value_type,
+                    "bytes": size,
+                    f"recall@{k}": recall(measured["ids"], baseline),
+                    "p50_ms": measured["p50_ms"],
+                    "p99_ms": measured["p99_ms"],
+                }
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="data/lancedb")
+    parser.add_argument("--table", default="docling")
+    parser.add_argument(
+        "--dimensions",
+        type=int,
+        nargs="+",
+        default=[0, 1024, 512, 256],
+        help="Dimensions to shorten to; 0 for the full size",
+    )
+    parser.add_argument(
+        "--value-types",
+        nargs="+",
+        choices=list(VALUE_TYPES),
+        default=list(VALUE_TYPES),
+    )
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument(
+        "--output", type=Path, default=Path("benchmarks/results/embedding_storage.json")
+    )
+    args = parser.parse_args()
+
+    vectors = load_vectors(args.db, args.table)
+    variants = run(
+        vectors,
+        [dims or None for dims in args.dimensions],
+        args.value_types,
+        args.queries,
+        args.k,
+    )
+    results = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "rows": len(vectors),
+        "queries": min(args.queries, len(vectors)),
+        "k": args.k,
+        "variants": variants,
+    }
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(results, indent=2))
+
+    baseline = variants[0]["bytes"]
+    for v in variants:
+        print(
+            f"{v['dimensions']:>5} x {v['value_type']:<8} "
+            f"{v['bytes'] / 1024 / 1024:>8,.1f} MiB ({v['bytes'] / baseline:>4.0%})  "
+            f"recall@{args.k} {v[f'recall@{args.k}']:.3f}  "
+            f"p50 {v['p50_ms']:.2f} ms  p99 {v['p99_ms']:.2f} ms"
+        )
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
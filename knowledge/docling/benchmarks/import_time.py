@@ -0,0 +1,97 @@
+"""Cold-start time of chunking with each tokenizer adapter.
+
+Every measurement runs in a fresh interpreter, so it includes the imports of
+docling's HybridChunker (which loads transformers whichever tokenizer is used),
+the tokenizer and chunking a synthetic document. The import of the tokenizer
+module alone is reported as well. Run from knowledge/docling:
+
+    python -m benchmarks.import_time --output benchmarks/results/import_time.json
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+TOKENIZERS = {
+    "OpenAITokenizerWrapper (transformers)": (
+        "from utils.tokenizer import OpenAITokenizerWrapper",
+        "HuggingFaceTokenizer(tokenizer=OpenAITokenizerWrapper(), max_tokens=8191)",
+    ),
+    "TiktokenTokenizer": (
+        "from utils.tiktoken_tokenizer import TiktokenTokenizer",
+        "TiktokenTokenizer(max_tokens=8191)",
+    ),
+}
+
+CHUNKING = """
+{import_tokenizer}
+from docling.chunking import HybridChunker
+from docling_core.transforms.chunker.tokenizer.huggingface import HuggingFaceTokenizer
+from docling_core.types.doc import DocItemLabel, DoclingDocument
+
+document = DoclingDocument(name="benchmark")
+for section in range({sections}):
+    document.add_heading(text=f"Section {{section}}")
+    for paragraph in range(20):
+        document.add_text(
+            label=DocItemLabel.TEXT,
+            text=f"Paragraph {{paragraph}} of section {{section}}. " * 40,
+        )
+chunker = HybridChunker(tokenizer={tokenizer}, merge_peers=True)
+chunks = list(chunker.chunk(dl_doc=document))
+"""
+
+
+def measure(statement: str, repeat: int) -> list:
+    """Times a fresh interpreter running the statement, `repeat` times."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", statement], check=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--sections", type=int, default=50, help="Sections of the synthetic document"
+    )
+    parser.add_argument(
+        "--output", type=Path, default=Path("benchmarks/results/import_time.json")
+    )
+    args = parser.parse_args()
+
+    baseline = statistics.median(measure("pass", args.repeat))
+    results = {"interpreter_startup_seconds": baseline, "tokenizers": {}}
+    for name, (import_tokenizer, tokenizer) in TOKENIZERS.items():
+        chunking = CHUNKING.format(
+            import_tokenizer=import_tokenizer,
+            tokenizer=tokenizer,
+            sections=args.sections,
+        )
+        # Warm-up run, so tiktoken's downloaded encodings are cached on disk
+        measure(chunking, 1)
+        import_seconds = statistics.median(measure(import_tokenizer, args.repeat))
+        end_to_end_seconds = statistics.median(measure(chunking, args.repeat))
+        results["tokenizers"][name] = {
+            "import_seconds": import_seconds - baseline,
+            "end_to_end_seconds": end_to_end_seconds - baseline,
+        }
+        print(
+            f"{name:<40} import {import_seconds - baseline:6.2f}s  "
+            f"import + chunking {end_to_end_seconds - baseline:6.2f}s"
+        )
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""Recall@k and p50/p99 latency of the vector index against exact search.
+
+Sweeps the query-time knobs (nprobes and refine_factor for IVF_PQ, nprobes and
+ef for IVF_HNSW_SQ) so index settings can be picked from data. Run from
+knowledge/docling on a synthetic table:
+
+    python -m benchmarks.index_sweep --rows 200000 --dim 256
+
+or on the vectors of the ingested table, copied into a temporary table so the
+ingested table and its indexes are left untouched:
+
+    python -m benchmarks.index_sweep --db data/lancedb --table docling
+
+A plot is written next to the JSON results when matplotlib is installed.
+"""
+
+import argparse
+import json
+import platform
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import lancedb
+import numpy as np
+import pyarrow as pa
+from utils.indexes import create_vector_index
+from utils.search import tune_vector_query
+
+
+def synthetic_table(db, rows: int, dim: int, seed: int = 0):
+    """Creates a table of clustered unit vectors, which look more like embeddings
+    than uniform noise does."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(rows // 1000, 1), dim))
+    vectors = centers[rng.integers(0, len(centers), rows)]
+    vectors += rng.normal(scale=0.2, size=(rows, dim))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    data = pa.table(
+        {
+            "id": pa.array(np.arange(rows)),
+            "vector": pa.FixedSizeListArray.from_arrays(
+                pa.array(vectors.astype(np.float32).ravel()), dim
+            ),
+        }
+    )
+    return db.create_table("sweep", data=data, mode="overwrite")
+
+
+def copy_vectors(source, db):
+    """Copies the vectors of a table into a table of its own in another database,
+    so building indexes for the sweep never changes the source table."""
+    vectors = source.search().select(["vector"]).limit(None).to_arrow()["vector"]
+    data = pa.table({"id": pa.array(np.arange(len(vectors))), "vector": vectors})
+    return db.create_table("sweep", data=data, mode="overwrite")
+
+
+def query_vectors(table, n: int, seed: int = 1) -> np.ndarray:
+    """Samples stored vectors and perturbs them, so queries are near but not on rows."""
+    rng = np.random.default_rng(seed)
+    total = table.count_rows()
+    ids = rng.choice(total, size=min(n, total), replace=False)
+    vectors = np.stack(
+        table.take_offsets(ids.tolist())
+        .to_arrow()["vector"]
+        .to_numpy(zero_copy_only=False)
+    )
+    vectors = vectors + rng.normal(scale=0.05, size=vectors.shape)
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def run_queries(table, queries: np.ndarray, k: int, **knobs) -> Dict[str, Any]:
+    """Runs every query with the given knobs and returns row ids and latencies."""
+    ids, latencies = [], []
+    for vector in queries:
+        builder = table.search(vector, vector_column_name="vector").limit(k)
+        builder = tune_vector_query(builder, **knobs).with_row_id(True)
+        start = time.perf_counter()
+        result = builder.select([]).to_arrow()
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids.append(set(result["_rowid"].to_pylist()))
+    return {
+        "ids": ids,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def recall(found: List[set], truth: List[set]) -> float:
+    """Mean fraction of the exact nearest neighbours that were found."""
+    return float(np.mean([len(f & t) / max(len(t), 1) for f, t in zip(found, truth)]))
+
+
+def sweep(
+    table,
+    index_type: str,
+    queries: np.ndarray,
+    k: int,
+    nprobes: List[int],
+    second_knob: List[Optional[int]],
+) -> Dict[str, Any]:
+    exact = run_queries(table, queries, k, exact=True)
+
+    start = time.perf_counter()
+    create_vector_index(table, index_type=index_type, min_rows=0)
+    build_seconds = time.perf_counter() - start
+
+    # refine_factor tunes IVF_PQ, ef tunes the HNSW graph of IVF_HNSW_SQ
+    knob = "refine_factor" if index_type == "IVF_PQ" else "ef"
+    points = []
+    for value in second_knob:
+        for n in nprobes:
+            result = run_queries(table, queries, k, nprobes=n, **{knob: value})
+            points.append(
+                {
+                    "nprobes": n,
+                    knob: value,
+                    f"recall@{k}": recall(result["ids"], exact["ids"]),
+                    "p50_ms": result["p50_ms"],
+                    "p99_ms": result["p99_ms"],
+                }
+            )
+
+    return {
+        "index_type": index_type,
+        "build_seconds": build_seconds,
+        "exact": {"p50_ms": exact["p50_ms"], "p99_ms": exact["p99_ms"]},
+        "knob": knob,
+        "points": points,
+    }
+
+
+def plot(results: Dict[str, Any], path: Path):
+    """Plots recall@k against p50 and p99 latency, one line per second knob value."""
+    try:
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("Install matplotlib to plot the sweep")
+        return
+
+    k, knob = results["k"], results["knob"]
+    fig, axes = plt.subplots(1, 2, figsize=(12, 5), sharey=True)
+    for ax, latency in zip(axes, ("p50_ms", "p99_ms")):
+        for value in sorted(
+            {p[knob] for p in results["points"]}, key=lambda v: (v is None, v)
+        ):
+            points = [p for p in results["points"] if p[knob] == value]
+            ax.plot(
+                [p[latency] for p in points],
+                [p[f"recall@{k}"] for p in points],
+                marker="o",
+                label=f"{knob}={value}",
+            )
+            for p in points:
+                ax.annotate(
+                    str(p["nprobes"]),
+                    (p[latency], p[f"recall@{k}"]),
+                    fontsize=7,
+                )
+        ax.scatter([results["exact"][latency]], [1.0], color="black", label="exact")
+        ax.set_xscale("log")
+        ax.set_xlabel(f"{latency[:3]} latency (ms)")
+        ax.grid(True, alpha=0.3)
+    axes[0].set_ylabel(f"recall@{k}")
+    axes[0].legend()
+    fig.suptitle(
+        f"{results['index_type']} on {results['rows']:,} rows "
+        "(points labelled with nprobes)"
+    )
+    fig.tight_layout()
+    fig.savefig(path)
+    print(f"Plot written to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", help="LanceDB to sweep (default: synthetic table)")
+    parser.add_argument("--table", default="docling")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument(
+        "--index-type", choices=["IVF_PQ", "IVF_HNSW_SQ"], default="IVF_PQ"
+    )
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument(
+        "--nprobes", type=int, nargs="+", default=[1, 5, 10, 20, 50, 100]
+    )
+    parser.add_argument(
+        "--refine-factors",
+        type=int,
+        nargs="+",
+        default=[0, 5, 20],
+        help="refine_factor (IVF_PQ) or ef (IVF_HNSW_SQ) values; 0 for the default",
+    )
+    parser.add_argument(
+        "--output", type=Path, default=Path("benchmarks/results/index_sweep.json")
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = lancedb.connect(tmp_dir)
+        if args.db:
+            source = lancedb.connect(args.db).open_table(args.table)
+            table = copy_vectors(source, db)
+        else:
+            table = synthetic_table(db, args.rows, args.dim)
+
+        queries = query_vectors(table, args.queries)
+        second_knob = [value or None for value in args.refine_factors]
+        results = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "rows": table.count_rows(),
+            "queries": len(queries),
+            "k": args.k,
+            **sweep(table, args.index_type, queries, args.k, args.nprobes, second_knob),
+        }
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(results, indent=2))
+
+    exact = results["exact"]
+    print(
+        f"exact search: p50 {exact['p50_ms']:.2f} ms, p99 {exact['p99_ms']:.2f} ms "
+        f"(index built in {results['build_seconds']:.1f} s)"
+    )
+    for p in results["points"]:
+        print(
+            f"nprobes={p['nprobes']:<4} {results['knob']}={str(p[results['knob']]):<5}"
+            f" recall@{args.k} {p[f'recall@{args.k}']:.3f}  "
+            f"p50 {p['p50_ms']:.2f} ms  p99 {p['p99_ms']:.2f} ms"
+        )
+    print(f"Results written to {args.output}")
+    plot(results, args.output.with_suffix(".png"))
+
+
+if __name__ == "__main__":
+    main()
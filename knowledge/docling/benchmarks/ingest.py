@@ -0,0 +1,264 @@
+"""Throughput benchmark for the extraction -> chunking -> embedding -> write pipeline.
+
+Every stage runs the code 3-embedding.py uses: HybridChunker with
+TiktokenTokenizer, EmbeddingBatcher.embed_records and stream_to_table into a
+table with the same schema. Only the embeddings API is stubbed by default:
+requests go to an in-process stand-in that returns `hashing` embeddings, so no
+API calls are made and the embedding stage measures packing, token counting and
+concurrent requests, not network time. Pass --openai to send real (billed)
+requests to text-embedding-3-large. Run from knowledge/docling:
+
+    python -m benchmarks.ingest --output benchmarks/results/ingest.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+import lancedb
+import pyarrow as pa
+from docling.chunking import HybridChunker
+from docling.document_converter import DocumentConverter
+from lancedb.pydantic import LanceModel, Vector
+from openai import OpenAI
+from utils.embeddings import EmbeddingBatcher, create_embedding_function
+from utils.ingest import chunk_records, document_hash, stream_to_table
+from utils.profiles import AdaptiveConverter
+from utils.tiktoken_tokenizer import TiktokenTokenizer
+
+CORPUS_DIR = Path(__file__).parent / "corpus"
+MAX_TOKENS = 8191
+
+
+class PeakRss:
+    """Samples the resident set size of this process while a stage runs."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    @staticmethod
+    def current_bytes() -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            # No procfs (e.g. macOS): fall back to the process high-water mark
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return max_rss if platform.system() == "Darwin" else max_rss * 1024
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak_bytes = max(self.peak_bytes, self.current_bytes())
+            time.sleep(self.interval)
+
+    def __enter__(self) -> "PeakRss":
+        self.peak_bytes = self.current_bytes()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, self.current_bytes())
+
+
+class OfflineEmbeddingsClient:
+    """Stand-in for the OpenAI client's embeddings API, computed in process.
+
+    Answers `client.embeddings.create` with deterministic hashing embeddings,
+    so EmbeddingBatcher runs unchanged without network access or API costs.
+    """
+
+    def __init__(self, func):
+        self.embeddings = SimpleNamespace(create=self._create)
+        self._func = func
+
+    def _create(self, model: str, input: List[str], **options) -> SimpleNamespace:
+        vectors = self._func.compute_source_embeddings(input)
+        return SimpleNamespace(
+            data=[SimpleNamespace(embedding=vector) for vector in vectors]
+        )
+
+
+def chunks_schema(func, value_type=pa.float32()) -> type:
+    """The Chunks schema of 3-embedding.py for an embedding function."""
+
+    class ChunkMetadata(LanceModel):
+        filename: str | None
+        page_numbers: List[int] | None
+        title: str | None
+
+    class Chunks(LanceModel):
+        text: str = func.SourceField()
+        vector: Vector(func.ndims(), value_type=value_type) = func.VectorField()  # type: ignore
+        metadata: ChunkMetadata
+        filename: str | None
+        page_numbers: List[int] | None
+        title: str | None
+        doc_id: str
+        doc_hash: str
+        chunk_hash: str
+
+    return Chunks
+
+
+def run(
+    corpus_dir: Path,
+    repeat: int,
+    batch_size: int,
+    adaptive: bool = False,
+    use_openai: bool = False,
+) -> Dict[str, Any]:
+    sources = (
+        sorted(
+            str(path)
+            for path in corpus_dir.iterdir()
+            if path.suffix in {".pdf", ".html"}
+        )
+        * repeat
+    )
+    if not sources:
+        raise ValueError(f"No .pdf or .html files in {corpus_dir}")
+    stages: Dict[str, Dict[str, Any]] = {}
+
+    # Conversion
+    converter = AdaptiveConverter() if adaptive else DocumentConverter()
+    with PeakRss() as rss:
+        start = time.perf_counter()
+        documents = [converter.convert(source).document for source in sources]
+        seconds = time.perf_counter() - start
+    pages = sum(max(len(document.pages), 1) for document in documents)
+    stages["conversion"] = {
+        "profiles": dict(converter.counts) if adaptive else {"full": len(sources)},
+        "documents": len(documents),
+        "pages": pages,
+        "seconds": seconds,
+        "pages_per_second": pages / seconds,
+        "peak_rss_bytes": rss.peak_bytes,
+    }
+
+    # Chunking
+    doc_hashes = [document_hash(document) for document in documents]
+    tokenizer = TiktokenTokenizer(max_tokens=MAX_TOKENS)
+    chunker = HybridChunker(tokenizer=tokenizer, merge_peers=True)
+    with PeakRss() as rss:
+        start = time.perf_counter()
+        records = [
+            {**record, "doc_id": source, "doc_hash": doc_hash}
+            for source, document, doc_hash in zip(sources, documents, doc_hashes)
+            for record in chunk_records(chunker.chunk(dl_doc=document))
+        ]
+        seconds = time.perf_counter() - start
+    if not records:
+        raise ValueError(f"The corpus in {corpus_dir} produced no chunks")
+    stages["chunking"] = {
+        "chunks": len(records),
+        "seconds": seconds,
+        "chunks_per_second": len(records) / seconds,
+        "peak_rss_bytes": rss.peak_bytes,
+    }
+
+    # Embedding with EmbeddingBatcher, against the API or the offline stand-in
+    if use_openai:
+        func = create_embedding_function("openai")
+        client = OpenAI()
+    else:
+        func = create_embedding_function("hashing")
+        client = OfflineEmbeddingsClient(func)
+    batcher = EmbeddingBatcher(
+        client=client,
+        model=func.name if use_openai else "hashing",
+        tokenizer=tokenizer,
+        max_tokens_per_text=MAX_TOKENS,
+        max_concurrency=4,
+    )
+    with PeakRss() as rss:
+        start = time.perf_counter()
+        rows = list(batcher.embed_records(records, batch_size=batch_size))
+        seconds = time.perf_counter() - start
+    stages["embedding"] = {
+        "api": "openai" if use_openai else "offline stand-in (hashing embeddings)",
+        "tokens": batcher.tokens,
+        "seconds": seconds,
+        "tokens_per_second": batcher.tokens / seconds,
+        "peak_rss_bytes": rss.peak_bytes,
+    }
+
+    # Table writes with stream_to_table into the pipeline's schema
+    with tempfile.TemporaryDirectory() as db_dir, PeakRss() as rss:
+        table = lancedb.connect(db_dir).create_table(
+            "bench", schema=chunks_schema(func)
+        )
+        start = time.perf_counter()
+        written = stream_to_table(table, rows, batch_size=batch_size)
+        seconds = time.perf_counter() - start
+    stages["write"] = {
+        "rows": written,
+        "seconds": seconds,
+        "rows_per_second": written / seconds,
+        "peak_rss_bytes": rss.peak_bytes,
+    }
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "corpus": [Path(source).name for source in sources],
+        "batch_size": batch_size,
+        "adaptive": adaptive,
+        "stages": stages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", type=Path, default=CORPUS_DIR)
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="Process the corpus N times"
+    )
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Pick the fast or full pipeline profile per document",
+    )
+    parser.add_argument(
+        "--openai",
+        action="store_true",
+        help="Embed with the OpenAI API (billed) instead of the offline stand-in",
+    )
+    parser.add_argument(
+        "--output", type=Path, default=Path("benchmarks/results/ingest.json")
+    )
+    args = parser.parse_args()
+
+    results = run(args.corpus, args.repeat, args.batch_size, args.adaptive, args.openai)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(results, indent=2))
+
+    for name, stage in results["stages"].items():
+        rate = next(
+            f"{v:,.1f} {k}" for k, v in stage.items() if k.endswith("_per_second")
+        )
+        print(
+            f"{name:<11} {rate:<32} peak RSS {stage['peak_rss_bytes'] / 2**20:,.0f} MiB"
+        )
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Size and speed of the stored document format against other encodings.
+
+Every format is loaded by decoding to a dict and validating it with
+`model_validate`. JSON formats are also loaded with `model_validate_json`,
+which parses and validates in one pass; that is how `utils.serialization`
+loads the zlib-compressed JSON the conversion cache stores. MessagePack is
+measured too if it is installed. Run from knowledge/docling:
+
+    python -m benchmarks.serialization --output benchmarks/results/serialization.json
+"""
+
+import argparse
+import json
+import platform
+import time
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from docling.chunking import DocChunk, HybridChunker
+from docling.document_converter import DocumentConverter
+from docling_core.types.doc import DoclingDocument
+from pydantic import TypeAdapter
+from utils import serialization
+from utils.tiktoken_tokenizer import TiktokenTokenizer
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+CORPUS_DIR = Path(__file__).parent / "corpus"
+
+# name -> (encode a JSON-compatible object, decode it again, get the JSON bytes
+# back for model_validate_json or None if the format is not JSON)
+FORMATS: Dict[str, Any] = {
+    "json (indent=2)": (
+        lambda obj: json.dumps(obj, indent=2).encode("utf-8"),
+        json.loads,
+        lambda data: data,
+    ),
+    "json": (
+        lambda obj: json.dumps(obj).encode("utf-8"),
+        json.loads,
+        lambda data: data,
+    ),
+    "json+zlib (stored)": (
+        lambda obj: serialization.dumps(obj, compress=True),
+        serialization.loads,
+        serialization.to_json,
+    ),
+}
+if msgpack is not None:
+    FORMATS["msgpack"] = (
+        lambda obj: msgpack.packb(obj, use_bin_type=True),
+        lambda data: msgpack.unpackb(data, raw=False),
+        None,
+    )
+    FORMATS["msgpack+zlib"] = (
+        lambda obj: zlib.compress(msgpack.packb(obj, use_bin_type=True), 1),
+        lambda data: msgpack.unpackb(zlib.decompress(data), raw=False),
+        None,
+    )
+
+
+def _best_of(repeat: int, fn: Callable[[], Any]) -> float:
+    """Returns the fastest of several runs, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def measure(
+    exports: List[Any],
+    rebuild: Callable[[Any], Any],
+    rebuild_json: Callable[[bytes], Any],
+    repeat: int,
+) -> Dict[str, Dict[str, Optional[float]]]:
+    """Measures every format on a list of exported documents or chunk lists.
+
+    Args:
+        exports: JSON-compatible exports, one per document
+        rebuild: Builds the object back from a decoded export, e.g. model_validate
+        rebuild_json: Builds the object straight from JSON bytes, e.g.
+            model_validate_json
+        repeat: Number of timed runs per measurement
+
+    Returns:
+        Per format: total size, encode, decode, decode + validate and (JSON
+        formats only, else None) model_validate_json seconds
+    """
+    results = {}
+    for name, (encode, decode, json_bytes) in FORMATS.items():
+        encoded = [encode(export) for export in exports]
+        results[name] = {
+            "bytes": sum(len(data) for data in encoded),
+            "encode_seconds": _best_of(
+                repeat, lambda: [encode(export) for export in exports]
+            ),
+            "decode_seconds": _best_of(
+                repeat, lambda: [decode(data) for data in encoded]
+            ),
+            "load_seconds": _best_of(
+                repeat, lambda: [rebuild(decode(data)) for data in encoded]
+            ),
+            "load_json_seconds": (
+                _best_of(
+                    repeat,
+                    lambda: [rebuild_json(json_bytes(data)) for data in encoded],
+                )
+                if json_bytes is not None
+                else None
+            ),
+        }
+    return results
+
+
+def run(corpus_dir: Path, repeat: int) -> Dict[str, Any]:
+    sources = sorted(
+        str(path) for path in corpus_dir.iterdir() if path.suffix in {".pdf", ".html"}
+    )
+    converter = DocumentConverter()
+    documents = [converter.convert(source).document for source in sources]
+
+    chunker = HybridChunker(tokenizer=TiktokenTokenizer(), merge_peers=True)
+    chunk_lists = [list(chunker.chunk(dl_doc=document)) for document in documents]
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "corpus": [Path(source).name for source in sources],
+        "repeat": repeat,
+        "documents": measure(
+            [document.export_to_dict() for document in documents],
+            DoclingDocument.model_validate,
+            DoclingDocument.model_validate_json,
+            repeat,
+        ),
+        "chunks": measure(
+            [[chunk.export_json_dict() for chunk in chunks] for chunks in chunk_lists],
+            lambda exports: [DocChunk.model_validate(chunk) for chunk in exports],
+            TypeAdapter(List[DocChunk]).validate_json,
+            repeat,
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", type=Path, default=CORPUS_DIR)
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Timed runs per measurement"
+    )
+    parser.add_argument(
+        "--output", type=Path, default=Path("benchmarks/results/serialization.json")
+    )
+    args = parser.parse_args()
+
+    results = run(args.corpus, args.repeat)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(results, indent=2))
+
+    for kind in ("documents", "chunks"):
+        print(kind)
+        for name, result in results[kind].items():
+            load_json = result["load_json_seconds"]
+            print(
+                f"  {name:<20} {result['bytes'] / 1024:>9,.0f} KiB  "
+                f"encode {result['encode_seconds'] * 1000:>7,.1f} ms  "
+                f"decode {result['decode_seconds'] * 1000:>7,.1f} ms  "
+                f"load {result['load_seconds'] * 1000:>7,.1f} ms  "
+                + (
+                    f"load_json {load_json * 1000:>7,.1f} ms"
+                    if load_json is not None
+                    else ""
+                )
+            )
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+from io import BytesIO
+from pathlib import Path
+from typing import Optional, Tuple
+from urllib.parse import urlparse
+
+from docling.datamodel.base_models import DocumentStream
+from docling.document_converter import DocumentConverter
+from docling_core.types.doc import DoclingDocument
+
+from utils.fetch import Fetcher, get_fetcher
+from utils.serialization import dump_document, load_document, write_atomic
+
+_EXTENSIONS = {"pdf": ".pdf", "html": ".html", "xml": ".xml", "markdown": ".md"}
+
+
+def options_fingerprint(converter: DocumentConverter) -> str:
+    """Builds a stable string describing the pipeline options of a converter.
+
+    Args:
+        converter: The converter whose format options should be fingerprinted, or
+            an AdaptiveConverter
+
+    Returns:
+        JSON string of the pipeline, backend and options used for every format
+    """
+    # An AdaptiveConverter describes all of its profiles
+    if hasattr(converter, "fingerprint"):
+        return converter.fingerprint()
+
+    options = {}
+    for input_format, format_option in converter.format_to_options.items():
+        pipeline_options = format_option.pipeline_options
+        options[input_format.value] = {
+            "pipeline": format_option.pipeline_cls.__name__,
+            "backend": format_option.backend.__name__,
+            "options": (
+                pipeline_options.model_dump(mode="json")
+                if pipeline_options is not None
+                else None
+            ),
+        }
+    return json.dumps(options, sort_keys=True, default=str)
+
+
+def source_name(url: str, content_type: str = "") -> str:
+    """Builds a file name for a downloaded source that docling can detect the format of.
+
+    Args:
+        url: The URL the content was downloaded from
+        content_type: The Content-Type header of the response
+
+    Returns:
+        The last path segment of the URL, with an extension matching the content type
+    """
+    name = Path(urlparse(url).path).name or "index"
+    for kind, extension in _EXTENSIONS.items():
+        if kind in content_type and not name.endswith(extension):
+            return name + extension
+    return name
+
+
+def read_source(source: str, fetcher: Optional[Fetcher] = None) -> Tuple[str, bytes]:
+    """Reads the raw bytes of a local file or URL.
+
+    Args:
+        source: A file path or http(s) URL
+        fetcher: Fetch layer for URLs (default: the shared process-wide fetcher)
+
+    Returns:
+        Tuple of (name, content). The name carries a file extension so docling
+        can detect the input format from it.
+    """
+    if os.path.exists(source):
+        return Path(source).name, Path(source).read_bytes()
+
+    response = (fetcher or get_fetcher()).get(source)
+    response.raise_for_status()
+
+    name = source_name(source, response.headers.get("Content-Type", ""))
+    return name, response.content
+
+
+class ConversionCache:
+    """On-disk cache of converted documents keyed by source content and options."""
+
+    def __init__(
+        self,
+        converter: DocumentConverter,
+        cache_dir: str = "data/conversion_cache",
+        max_bytes: int = 2 * 1024**3,
+        compress: bool = True,
+    ):
+        """Initialize the cache.
+
+        Args:
+            converter: The converter used on cache misses (a DocumentConverter or
+                an AdaptiveConverter)
+            cache_dir: Directory where converted documents are stored
+            max_bytes: Total size above which least recently used entries are evicted
+            compress: zlib-compress the stored documents
+        """
+        self.converter = converter
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.hits = 0
+        self.misses = 0
+        self._options = options_fingerprint(converter)
+
+    def key(self, content: bytes) -> str:
+        """Returns the cache key for some source bytes under this converter's options."""
+        digest = hashlib.sha256(content)
+        digest.update(self._options.encode("utf-8"))
+        return digest.hexdigest()
+
+    def convert(self, source: str) -> DoclingDocument:
+        """Converts a source, reusing a cached document when the content is unchanged.
+
+        Args:
+            source: A file path or URL
+
+        Returns:
+            The converted DoclingDocument
+        """
+        name, content = read_source(source)
+        path = self.cache_dir / f"{self.key(content)}.json"
+
+        if path.exists():
+            self.hits += 1
+            os.utime(path)  # Mark as recently used
+            return load_document(path.read_bytes())
+
+        self.misses += 1
+        result = self.converter.convert(
+            DocumentStream(name=name, stream=BytesIO(content))
+        )
+        document = result.document
+
+        write_atomic(path, dump_document(document, compress=self.compress))
+
+        self._evict()
+        return document
+
+    def _evict(self):
+        """Removes least recently used entries until the cache fits in max_bytes."""
+        entries = sorted(
+            (entry.stat().st_mtime, entry.stat().st_size, entry)
+            for entry in self.cache_dir.iterdir()
+            if entry.suffix == ".json"
+        )
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total -= size
+
+    def report(self) -> str:
+        """Returns a one-line summary of cache hits and misses."""
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        return (
+            f"Conversion cache: {self.hits} hits, {self.misses} misses "
+            f"({hit_rate:.0%} hit rate)"
+        )
@@ -0,0 +1,187 @@
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import httpx
+from docling.datamodel.base_models import DocumentStream
+
+from utils.cache import source_name
+from utils.fetch import Fetcher, get_fetcher
+from utils.sitemap import SitemapEntry
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PageVersion:
+    """What we know about the version of a page we last converted."""
+
+    url: str
+    lastmod: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+class CrawlState:
+    """Persists the sitemap lastmod and HTTP validators of every crawled page.
+
+    On the next crawl, a page whose sitemap lastmod did not change is skipped
+    without a request, and other pages are fetched with a conditional GET so
+    an unchanged page costs a 304 instead of a download and a conversion.
+    Pages that could not be fetched or converted are recorded with their error
+    until they are converted successfully.
+    """
+
+    def __init__(self, path: str = "data/crawl_state.sqlite"):
+        """Initialize the state.
+
+        Args:
+            path: SQLite file the state is stored in
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._db:
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    url TEXT PRIMARY KEY,
+                    lastmod TEXT,
+                    etag TEXT,
+                    last_modified TEXT,
+                    updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS failures (
+                    url TEXT PRIMARY KEY,
+                    error TEXT NOT NULL,
+                    failed_at REAL NOT NULL
+                );
+                """)
+        self.skipped = 0
+        self.not_modified = 0
+        self.fetched = 0
+        self.failed = 0
+
+    def get(self, url: str) -> Optional[PageVersion]:
+        """Returns the stored version of a page, if it was converted before."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT url, lastmod, etag, last_modified FROM pages WHERE url = ?",
+                (url,),
+            ).fetchone()
+        return PageVersion(*row) if row else None
+
+    def save(self, version: PageVersion):
+        """Records a page version. Call this only once the page was converted."""
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+                (
+                    version.url,
+                    version.lastmod,
+                    version.etag,
+                    version.last_modified,
+                    time.time(),
+                ),
+            )
+            self._db.execute("DELETE FROM failures WHERE url = ?", (version.url,))
+
+    def record_failure(self, url: str, error: str):
+        """Records that a page could not be fetched or converted, so it is retried
+        on the next crawl."""
+        self.failed += 1
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO failures VALUES (?, ?, ?)",
+                (url, error, time.time()),
+            )
+
+    def failures(self) -> Dict[str, str]:
+        """Returns the error of every page whose last fetch or conversion failed,
+        by URL."""
+        with self._lock:
+            rows = self._db.execute("SELECT url, error FROM failures").fetchall()
+        return dict(rows)
+
+    def is_unchanged(self, entry: SitemapEntry) -> bool:
+        """Returns True if the sitemap lists the same lastmod as the stored version."""
+        if entry.lastmod is None:
+            return False
+        stored = self.get(entry.loc)
+        return stored is not None and stored.lastmod == entry.lastmod
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """Returns the If-None-Match / If-Modified-Since headers for a page."""
+        stored = self.get(url)
+        headers = {}
+        if stored is not None and stored.etag:
+            headers["If-None-Match"] = stored.etag
+        if stored is not None and stored.last_modified:
+            headers["If-Modified-Since"] = stored.last_modified
+        return headers
+
+    def report(self) -> str:
+        """Returns a one-line summary of skipped, unmodified and fetched pages."""
+        return (
+            f"Crawl: {self.skipped} skipped by lastmod, "
+            f"{self.not_modified} not modified (304), {self.fetched} fetched, "
+            f"{self.failed} failed"
+        )
+
+
+def fetch_changed(
+    entries: Iterable[SitemapEntry],
+    state: CrawlState,
+    fetcher: Optional[Fetcher] = None,
+) -> Iterator[Tuple[PageVersion, DocumentStream]]:
+    """Fetches only the sitemap pages that changed since they were last converted.
+
+    The returned version is not stored yet: pass it to `state.save` once the
+    page was converted, so a failed conversion is retried on the next crawl.
+    A page that cannot be fetched is logged, recorded with
+    `state.record_failure` and skipped; the other pages are still fetched.
+
+    Args:
+        entries: (loc, lastmod) entries, e.g. from `iter_sitemap_entries`
+        state: Stored page versions
+        fetcher: Fetch layer to use (default: the shared process-wide fetcher)
+
+    Yields:
+        Tuples of (new page version, stream ready for `DocumentConverter.convert`)
+    """
+    fetcher = fetcher or get_fetcher()
+    for entry in entries:
+        if state.is_unchanged(entry):
+            state.skipped += 1
+            continue
+
+        try:
+            response = fetcher.get(
+                entry.loc, headers=state.conditional_headers(entry.loc)
+            )
+            stored = state.get(entry.loc)
+            if response.status_code == 304 and stored is not None:
+                state.not_modified += 1
+                # Remember the new lastmod so the next crawl skips the request
+                stored.lastmod = entry.lastmod
+                state.save(stored)
+                continue
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            logger.warning("Failed to fetch %s: %s", entry.loc, e)
+            state.record_failure(entry.loc, str(e))
+            continue
+        state.fetched += 1
+
+        version = PageVersion(
+            url=entry.loc,
+            lastmod=entry.lastmod,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+        name = source_name(entry.loc, response.headers.get("Content-Type", ""))
+        yield version, DocumentStream(name=name, stream=BytesIO(response.content))
@@ -0,0 +1,318 @@
+import json
+import re
+import zlib
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+
+from utils.ingest import sql_quote, stream_to_table
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = (1 << 32) - 1  # crc32 range
+
+PROVENANCE_SCHEMA = pa.schema(
+    [
+        pa.field("doc_id", pa.string()),
+        pa.field("chunk_hash", pa.string()),
+        pa.field("duplicate_of", pa.string()),
+        pa.field("similarity", pa.float32()),
+        pa.field("record", pa.string()),  # The dropped row as JSON, to re-admit it
+    ]
+)
+
+
+def _lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """Picks the (bands, rows) split whose S-curve midpoint is closest to threshold."""
+    candidates = [
+        (b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0
+    ]
+    return min(candidates, key=lambda br: abs((1 / br[0]) ** (1 / br[1]) - threshold))
+
+
+class NearDuplicateFilter:
+    """Drops chunks that are near-duplicates of a chunk seen earlier (MinHash + LSH).
+
+    Every dropped chunk is recorded in `provenance` together with the chunk it
+    duplicates, so the source URL of each copy is kept. Seed the filter with the
+    chunks already in the table so results do not depend on what earlier runs
+    ingested, and re-admit duplicates whose kept copy was removed since.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        num_perm: int = 128,
+        shingle_size: int = 5,
+        seed: int = 1,
+    ):
+        """Initialize the filter.
+
+        Args:
+            threshold: Estimated Jaccard similarity above which a chunk is a duplicate
+            num_perm: Number of MinHash permutations
+            shingle_size: Number of words per shingle
+            seed: Seed for the MinHash permutations
+        """
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = _lsh_params(threshold, num_perm)
+
+        rng = np.random.default_rng(seed)
+        # a < 2**31 keeps a * x + b below 2**64 for 32-bit shingle hashes
+        self._a = rng.integers(1, 1 << 31, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MAX_HASH, size=num_perm, dtype=np.uint64)
+
+        self._buckets: List[Dict[bytes, List[str]]] = [
+            defaultdict(list) for _ in range(self.bands)
+        ]
+        self._signatures: Dict[str, np.ndarray] = {}
+        self.provenance: List[Dict[str, Any]] = []
+        self.kept = 0
+        self._doc_ids = set()  # Documents filtered since the last save
+        self._saved = 0  # Entries of `provenance` already saved
+        self._seed = None  # (table, batch_size) still to be indexed
+
+    def _shingles(self, text: str) -> np.ndarray:
+        words = re.findall(r"\w+", text.lower())
+        size = min(self.shingle_size, len(words)) or 1
+        shingles = {
+            " ".join(words[i : i + size]) for i in range(max(len(words) - size + 1, 1))
+        }
+        return np.array(
+            [zlib.crc32(s.encode("utf-8")) for s in shingles], dtype=np.uint64
+        )
+
+    def signature(self, text: str) -> np.ndarray:
+        """Returns the MinHash signature of a text."""
+        hashes = self._shingles(text)
+        # (a * x + b) mod p for every permutation and shingle; fits in uint64
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME
+        return permuted.min(axis=1)
+
+    def _band_keys(self, signature: np.ndarray) -> Iterator[Tuple[int, bytes]]:
+        for band in range(self.bands):
+            yield band, signature[band * self.rows : (band + 1) * self.rows].tobytes()
+
+    def find(self, signature: np.ndarray) -> Tuple[str, float]:
+        """Returns the best matching kept chunk above the threshold, if any.
+
+        Returns:
+            Tuple of (chunk_hash, similarity), or ("", 0.0) if there is no match
+        """
+        candidates = {
+            key
+            for band, band_key in self._band_keys(signature)
+            for key in self._buckets[band].get(band_key, ())
+        }
+        best, best_similarity = "", 0.0
+        for key in candidates:
+            similarity = float(np.mean(self._signatures[key] == signature))
+            if similarity >= self.threshold and similarity > best_similarity:
+                best, best_similarity = key, similarity
+        return best, best_similarity
+
+    def add(self, key: str, signature: np.ndarray):
+        """Indexes a kept chunk so later chunks are compared against it."""
+        self._signatures[key] = signature
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band][band_key].append(key)
+
+    def discard(self, key: str):
+        """Removes a chunk from the index, e.g. because it was deleted from the table."""
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        for band, band_key in self._band_keys(signature):
+            bucket = self._buckets[band].get(band_key)
+            if bucket and key in bucket:
+                bucket.remove(key)
+
+    def seed(self, table, batch_size: int = 4096):
+        """Indexes the chunks already in a table, once the first record is filtered.
+
+        Signing the corpus costs a pass over every chunk, so the table is only
+        read when a record actually needs checking: a run in which no document
+        changed never pays for it.
+
+        Args:
+            table: LanceDB table with chunk_hash and text columns
+            batch_size: Number of rows read at a time
+        """
+        self._seed = (table, batch_size)
+
+    def _load_seed(self):
+        if self._seed is None:
+            return
+        table, batch_size = self._seed
+        self._seed = None
+        reader = (
+            table.search()
+            .select(["chunk_hash", "text"])
+            .limit(None)
+            .to_batches(batch_size)
+        )
+        for batch in reader:
+            for key, text in zip(
+                batch["chunk_hash"].to_pylist(), batch["text"].to_pylist()
+            ):
+                if key not in self._signatures:
+                    self.add(key, self.signature(text))
+
+    def filter(self, records: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Yields only records that are not near-duplicates of an earlier record.
+
+        Args:
+            records: Rows with text, chunk_hash and doc_id fields, consumed lazily
+
+        Yields:
+            The records that were kept
+        """
+        for record in records:
+            self._load_seed()
+            self._doc_ids.add(record["doc_id"])
+            signature = self.signature(record["text"])
+            duplicate_of, similarity = self.find(signature)
+            if duplicate_of:
+                self.provenance.append(
+                    {
+                        "doc_id": record["doc_id"],
+                        "chunk_hash": record["chunk_hash"],
+                        "duplicate_of": duplicate_of,
+                        "similarity": similarity,
+                        "record": json.dumps(
+                            {k: v for k, v in record.items() if k != "vector"}
+                        ),
+                    }
+                )
+                continue
+            self.add(record["chunk_hash"], signature)
+            self.kept += 1
+            yield record
+
+    def save_provenance(self, db, table_name: str = "docling_duplicates"):
+        """Stores the duplicates dropped since the last save in a LanceDB table.
+
+        Previous entries of every document filtered since the last save are
+        replaced. Save after each document, before it is recorded as written,
+        so a run that is interrupted never skips a document whose entries
+        were lost.
+
+        Args:
+            db: LanceDB connection
+            table_name: Name of the provenance table
+        """
+        if not self._doc_ids and self._saved == len(self.provenance):
+            return
+        table = self._provenance_table(db, table_name)
+        if self._doc_ids:
+            id_list = ", ".join(sql_quote(doc_id) for doc_id in self._doc_ids)
+            table.delete(f"doc_id IN ({id_list})")
+        if self._saved < len(self.provenance):
+            table.add(
+                pa.Table.from_pylist(
+                    self.provenance[self._saved :], schema=PROVENANCE_SCHEMA
+                )
+            )
+        self._doc_ids.clear()
+        self._saved = len(self.provenance)
+
+    def _provenance_table(self, db, table_name: str):
+        return db.create_table(table_name, schema=PROVENANCE_SCHEMA, exist_ok=True)
+
+    def readmit(
+        self,
+        db,
+        table,
+        doc_ids: Iterable[str],
+        prepare: Optional[
+            Callable[[Iterable[Dict[str, Any]]], Iterable[Dict[str, Any]]]
+        ] = None,
+        table_name: str = "docling_duplicates",
+        batch_size: int = 256,
+    ) -> int:
+        """Adds back dropped duplicates whose kept copy is no longer in the table.
+
+        When the chunk a duplicate was dropped for is deleted (its document
+        changed or left the corpus), the duplicate is run through the filter
+        again and written unless it still duplicates another chunk. Entries of
+        documents that left the corpus are deleted. Call after the provenance
+        of every document was saved and after the run's deletes.
+
+        Args:
+            db: LanceDB connection
+            table: Chunk table the duplicates were dropped from
+            doc_ids: Identifiers of all documents in the current corpus
+            prepare: Optional stage applied to the re-admitted rows before they
+                are written, e.g. `EmbeddingBatcher.embed_records`
+            table_name: Name of the provenance table
+            batch_size: Number of rows per `table.add` call
+
+        Returns:
+            Number of re-admitted chunks
+        """
+        provenance = self._provenance_table(db, table_name)
+        id_list = ", ".join(sql_quote(doc_id) for doc_id in doc_ids)
+        provenance.delete(f"doc_id NOT IN ({id_list})" if id_list else "true")
+
+        entries = provenance.search().limit(None).to_list()
+        kept_copies = sorted({entry["duplicate_of"] for entry in entries})
+        present = set()
+        for i in range(0, len(kept_copies), 500):
+            hash_list = ", ".join(sql_quote(h) for h in kept_copies[i : i + 500])
+            rows = (
+                table.search()
+                .where(f"chunk_hash IN ({hash_list})")
+                .select(["chunk_hash"])
+                .limit(None)
+                .to_list()
+            )
+            present.update(row["chunk_hash"] for row in rows)
+        removed = sorted(set(kept_copies) - present)
+        if not removed:
+            return 0
+
+        for key in removed:
+            self.discard(key)
+        orphans = [entry for entry in entries if entry["duplicate_of"] in removed]
+
+        # Re-admitted rows take the current hash of their document, so it still
+        # looks complete (documents without rows are synced on every run anyway)
+        doc_hashes = {}
+        for doc_id in {entry["doc_id"] for entry in orphans}:
+            rows = (
+                table.search()
+                .where(f"doc_id = {sql_quote(doc_id)}")
+                .select(["doc_hash"])
+                .limit(1)
+                .to_list()
+            )
+            doc_hashes[doc_id] = rows[0]["doc_hash"] if rows else ""
+
+        start = len(self.provenance)
+        records = (
+            {**json.loads(entry["record"]), "doc_hash": doc_hashes[entry["doc_id"]]}
+            for entry in orphans
+        )
+        rows = self.filter(records)
+        if prepare is not None:
+            rows = prepare(rows)
+        added = stream_to_table(table, rows, batch_size=batch_size)
+
+        # Orphans that still duplicate another chunk were recorded again
+        for i in range(0, len(removed), 500):
+            hash_list = ", ".join(sql_quote(h) for h in removed[i : i + 500])
+            provenance.delete(f"duplicate_of IN ({hash_list})")
+        if len(self.provenance) > start:
+            provenance.add(
+                pa.Table.from_pylist(self.provenance[start:], schema=PROVENANCE_SCHEMA)
+            )
+        self._doc_ids.clear()
+        self._saved = len(self.provenance)
+        return added
+
+    def report(self) -> str:
+        """Returns a one-line summary of kept and dropped chunks."""
+        return f"Near-duplicates: {self.kept} kept, " f"{len(self.provenance)} dropped"
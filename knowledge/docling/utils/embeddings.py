@@ -0,0 +1,778 @@
+import hashlib
+import os
+import random
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import openai
+from lancedb.embeddings import TextEmbeddingFunction, get_registry, register
+from lancedb.embeddings.openai import OpenAIEmbeddings
+from openai import OpenAI
+
+from utils.tiktoken_tokenizer import TiktokenTokenizer
+
+# Errors worth retrying: throttling and transient server/network failures
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """File-backed store of embeddings keyed by model, dimensions and text hash."""
+
+    def __init__(self, path: str = "data/embedding_cache.sqlite"):
+        """Initialize the cache.
+
+        Args:
+            path: SQLite file the embeddings are stored in
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                dimensions INTEGER NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, dimensions, text_hash)
+            )
+            """)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(
+        self, model: str, dimensions: Optional[int], texts: Iterable[str]
+    ) -> Dict[str, List[float]]:
+        """Looks up cached embeddings.
+
+        Args:
+            model: Embedding model name
+            dimensions: Requested output dimensions, None for the model default
+            texts: Texts to look up
+
+        Returns:
+            Mapping from text to embedding for the texts that were cached
+        """
+        hashes = {text_hash(text): text for text in texts}
+        found = {}
+        with self._lock:
+            hash_list = list(hashes)
+            # Stay below SQLite's limit on query parameters
+            for i in range(0, len(hash_list), 500):
+                part = hash_list[i : i + 500]
+                rows = self._db.execute(
+                    "SELECT text_hash, vector FROM embeddings "
+                    "WHERE model = ? AND dimensions = ? "
+                    f"AND text_hash IN ({', '.join('?' * len(part))})",
+                    [model, dimensions or 0, *part],
+                )
+                for digest, blob in rows:
+                    found[hashes[digest]] = array("f", blob).tolist()
+        self.hits += len(found)
+        self.misses += len(hashes) - len(found)
+        return found
+
+    def put_many(
+        self, model: str, dimensions: Optional[int], embeddings: Dict[str, List[float]]
+    ):
+        """Stores embeddings.
+
+        Args:
+            model: Embedding model name
+            dimensions: Requested output dimensions, None for the model default
+            embeddings: Mapping from text to embedding
+        """
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)",
+                [
+                    (
+                        model,
+                        dimensions or 0,
+                        text_hash(text),
+                        array("f", vector).tobytes(),
+                    )
+                    for text, vector in embeddings.items()
+                ],
+            )
+
+    def report(self) -> str:
+        """Returns a one-line summary of cache hits and misses."""
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        return (
+            f"Embedding cache: {self.hits} hits, {self.misses} misses "
+            f"({hit_rate:.0%} hit rate)"
+        )
+
+
+# One cache per file, shared by every embedding function in the process
+_caches: Dict[str, EmbeddingCache] = {}
+
+
+def get_embedding_cache(path: str = "data/embedding_cache.sqlite") -> EmbeddingCache:
+    if path not in _caches:
+        _caches[path] = EmbeddingCache(path)
+    return _caches[path]
+
+
+def normalize_query(query: str) -> str:
+    """Normalizes a search query for cache lookups (Unicode NFKC, case-folded,
+    whitespace collapsed), so trivially different spellings share an entry."""
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+def compute_query_embeddings(
+    func: TextEmbeddingFunction, queries: List[str]
+) -> List[Optional[List[float]]]:
+    """Embeds queries through the query path of an embedding function.
+
+    Functions that keep the text embedding function's query path (or the
+    cached OpenAI one) take the whole list in one call, i.e. one API request;
+    functions that override it with a query-specific version are called once
+    per query.
+    """
+    batched = (
+        TextEmbeddingFunction.compute_query_embeddings,
+        CachedOpenAIEmbeddings.compute_query_embeddings,
+    )
+    if type(func).compute_query_embeddings in batched:
+        return list(func.compute_query_embeddings(queries))
+    return [func.compute_query_embeddings(query)[0] for query in queries]
+
+
+class QueryEmbeddingCache:
+    """LRU cache of query embeddings keyed by model, dimensions and normalized query.
+
+    Users ask the same questions over and over; a hit skips the round trip to
+    the embedding API (or the local model) entirely. Entries can also be kept in
+    an EmbeddingCache file, so they survive restarts of the app.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 4096,
+        path: Optional[str] = None,
+        tokenizer: Optional[TiktokenTokenizer] = None,
+        max_tokens_per_request: int = 300_000,
+        max_inputs_per_request: int = 2048,
+        max_tokens_per_text: int = 8191,
+    ):
+        """Initialize the cache.
+
+        Args:
+            max_size: Number of query embeddings kept in memory
+            path: SQLite file to persist query embeddings in (default: memory only)
+            tokenizer: Tokenizer used to count tokens per query
+            max_tokens_per_request: Token limit of a single embeddings request
+            max_inputs_per_request: Input limit of a single embeddings request
+            max_tokens_per_text: Context length of the embedding model
+        """
+        self.max_size = max_size
+        self.store = get_embedding_cache(path) if path else None
+        self.tokenizer = tokenizer or TiktokenTokenizer()
+        self.max_tokens_per_request = max_tokens_per_request
+        self.max_inputs_per_request = max_inputs_per_request
+        self.max_tokens_per_text = max_tokens_per_text
+        self._entries: OrderedDict = OrderedDict()  # (model, dims, query) -> vector
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def embed(self, func: TextEmbeddingFunction, query: str) -> List[float]:
+        """Returns the embedding of a query, computing it only on a cache miss.
+
+        Args:
+            func: Embedding function of the table being searched
+            query: Search query
+
+        Returns:
+            The query embedding
+        """
+        return self.embed_many(func, [query])[0]
+
+    def embed_many(
+        self, func: TextEmbeddingFunction, queries: List[str]
+    ) -> List[List[float]]:
+        """Returns the embeddings of several queries, preserving their order.
+
+        Queries missing from memory and from the store are embedded together
+        with `compute_query_embeddings`, split into as few requests as the
+        token and input limits of the embeddings API allow.
+
+        Args:
+            func: Embedding function of the table being searched
+            queries: Search queries
+
+        Returns:
+            One embedding per query
+
+        Raises:
+            ValueError: If a query is too long, or the embedding function
+                returned no vector for it (e.g. an empty query, or a request
+                the API rejected)
+        """
+        # Query entries get their own namespace in the persistent store, apart
+        # from the embeddings of chunk texts
+        model = f"query:{getattr(func, 'name', type(func).__name__)}"
+        dimensions = getattr(func, "dim", None) or 0
+        texts = [normalize_query(query) for query in queries]
+
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for text in texts:
+                vector = self._entries.get((model, dimensions, text))
+                if vector is not None:
+                    self._entries.move_to_end((model, dimensions, text))
+                    found[text] = vector
+
+        # Normalized text -> first spelling of the query, which gets embedded
+        missing = {}
+        for text, query in zip(texts, queries):
+            if text not in found:
+                missing.setdefault(text, query)
+        added = self.store.get_many(model, dimensions, missing) if self.store else {}
+        misses = [text for text in missing if text not in added]
+        computed = {}
+        if misses:
+            texts_to_embed = [missing[text] for text in misses]
+            token_counts = self.tokenizer.count_tokens_batch(texts_to_embed)
+            requests = pack_requests(
+                token_counts,
+                max_tokens_per_request=self.max_tokens_per_request,
+                max_inputs_per_request=self.max_inputs_per_request,
+                max_tokens_per_text=self.max_tokens_per_text,
+            )
+            for indices, _ in requests:
+                vectors = compute_query_embeddings(
+                    func, [texts_to_embed[i] for i in indices]
+                )
+                for i, vector in zip(indices, vectors):
+                    computed[misses[i]] = None if vector is None else list(vector)
+            # Empty or rejected queries come back as None instead of failing
+            failed = [missing[text] for text, v in computed.items() if v is None]
+            if failed:
+                raise ValueError(
+                    f"No embedding for {len(failed)} of the queries (empty, or "
+                    f"rejected by the embedding API), e.g. {failed[0]!r}"
+                )
+            if self.store:
+                self.store.put_many(model, dimensions, computed)
+            added.update(computed)
+
+        with self._lock:
+            # Found in memory or in the store counts as a hit
+            self.misses += sum(text in computed for text in texts)
+            self.hits += sum(text not in computed for text in texts)
+            for text, vector in added.items():
+                self._entries[(model, dimensions, text)] = vector
+                self._entries.move_to_end((model, dimensions, text))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        found.update(added)
+        return [found[text] for text in texts]
+
+    def report(self) -> str:
+        """Returns a one-line summary of cache hits (in memory or in the store)
+        and misses."""
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        return (
+            f"Query embedding cache: {self.hits} hits, {self.misses} misses "
+            f"({hit_rate:.0%} hit rate, {len(self._entries)} entries)"
+        )
+
+
+_query_cache: Optional[QueryEmbeddingCache] = None
+_query_cache_lock = threading.Lock()
+
+
+def get_query_cache() -> QueryEmbeddingCache:
+    """Returns the process-wide query cache used by the search utilities, persisted
+    next to the chunk embeddings."""
+    global _query_cache
+    with _query_cache_lock:
+        if _query_cache is None:
+            _query_cache = QueryEmbeddingCache(path="data/embedding_cache.sqlite")
+        return _query_cache
+
+
+@register("openai-cached")
+class CachedOpenAIEmbeddings(OpenAIEmbeddings):
+    """OpenAI embedding function that only sends cache misses to the API.
+
+    Tables created with it store `openai-cached` as their embedding function,
+    so import this module before opening them.
+    """
+
+    cache_path: str = "data/embedding_cache.sqlite"
+
+    def generate_embeddings(self, texts) -> List[List[float]]:
+        cache = get_embedding_cache(self.cache_path)
+        texts = list(texts)
+        unique = list(dict.fromkeys(texts))  # Embed repeated texts only once
+        vectors = cache.get_many(self.name, self.dim, unique)
+        misses = [text for text in unique if text not in vectors]
+        if misses:
+            computed = dict(zip(misses, super().generate_embeddings(misses)))
+            # Empty or rejected texts come back as None: return, but never cache them
+            cache.put_many(
+                self.name,
+                self.dim,
+                {
+                    text: vector
+                    for text, vector in computed.items()
+                    if vector is not None
+                },
+            )
+            vectors.update(computed)
+        return [vectors[text] for text in texts]
+
+    def compute_query_embeddings(self, query, *args, **kwargs) -> List[List[float]]:
+        # Queries are cached by QueryEmbeddingCache under their own namespace,
+        # so they are kept out of the cache of chunk texts
+        return OpenAIEmbeddings.generate_embeddings(self, self.sanitize_input(query))
+
+
+@register("hashing")
+class HashingEmbeddings(TextEmbeddingFunction):
+    """Deterministic local embeddings from a signed hashed bag of words.
+
+    Needs no model download or network and gives identical vectors across runs,
+    which makes it a good backend for tests, benchmarks and offline development.
+    """
+
+    dim: int = 384
+
+    def ndims(self) -> int:
+        return self.dim
+
+    def generate_embeddings(self, texts) -> List[List[float]]:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in str(text).lower().split():
+                digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+                bucket = int.from_bytes(digest, "little")
+                vectors[i, bucket % self.dim] += 1.0 if bucket >> 63 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return (vectors / np.maximum(norms, 1e-12)).tolist()
+
+
+def shorten_embeddings(vectors: np.ndarray, dimensions: int) -> np.ndarray:
+    """Truncates embeddings to their first `dimensions` values and re-normalizes them.
+
+    text-embedding-3 models are trained so that this gives the same vectors the
+    API returns when asked for `dimensions`, so stored full-size vectors can be
+    shortened without embedding the texts again.
+
+    Args:
+        vectors: Embeddings, one per row
+        dimensions: Number of dimensions to keep
+
+    Returns:
+        The shortened, unit-length embeddings
+    """
+    shortened = np.asarray(vectors, dtype=np.float32)[:, :dimensions]
+    norms = np.linalg.norm(shortened, axis=1, keepdims=True)
+    return shortened / np.maximum(norms, 1e-12)
+
+
+# Embedding backends selectable with create_embedding_function
+EMBEDDING_BACKENDS = {
+    "openai": ("openai-cached", {"name": "text-embedding-3-large"}),
+    "local": (
+        "sentence-transformers",
+        {"name": "BAAI/bge-small-en-v1.5", "device": "cpu"},
+    ),
+    "hashing": ("hashing", {}),
+}
+
+
+def create_embedding_function(
+    backend: str = "openai", dimensions: Optional[int] = None, **kwargs
+) -> TextEmbeddingFunction:
+    """Creates the embedding function of a backend from the LanceDB registry.
+
+    Args:
+        backend: "openai" (API, cached), "local" (small sentence-transformers
+            model on the CPU) or "hashing" (deterministic, no model)
+        dimensions: Output dimensions, e.g. 256, 512 or 1024 for the shortened
+            text-embedding-3 vectors (default: the model's full size)
+        **kwargs: Overrides for the embedding function's parameters
+
+    Returns:
+        The embedding function, usable in a LanceModel schema
+
+    Raises:
+        ValueError: If the backend is unknown or cannot shorten its vectors
+    """
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(
+            f"Unknown embedding backend {backend!r}, "
+            f"expected one of {', '.join(EMBEDDING_BACKENDS)}"
+        )
+    if dimensions is not None:
+        if backend == "local":
+            raise ValueError("The local backend does not support reduced dimensions")
+        kwargs["dim"] = dimensions
+    registry_name, defaults = EMBEDDING_BACKENDS[backend]
+    return get_registry().get(registry_name).create(**{**defaults, **kwargs})
+
+
+def table_name(
+    backend: str = "openai",
+    dimensions: Optional[int] = None,
+    float16: bool = False,
+    base: str = "docling",
+) -> str:
+    """Name of the chunk table for a set of embedding settings.
+
+    Every backend, dimension count and vector type needs its own vector column,
+    so each combination gets a table of its own and switching settings never
+    clashes with a table built before. The default settings (OpenAI, full size,
+    float32) keep the plain `base` name.
+    """
+    parts = [base]
+    if backend != "openai" or dimensions or float16:
+        parts.append(backend)
+    if dimensions:
+        parts.append(str(dimensions))
+    if float16:
+        parts.append("float16")
+    return "_".join(parts)
+
+
+def table_name_from_env(base: str = "docling") -> str:
+    """The chunk table name for the EMBEDDING_BACKEND, EMBEDDING_DIMENSIONS and
+    EMBEDDING_FLOAT16 environment variables read by 3-embedding.py."""
+    return table_name(
+        os.getenv("EMBEDDING_BACKEND", "openai"),
+        int(os.getenv("EMBEDDING_DIMENSIONS", 0)) or None,
+        bool(os.getenv("EMBEDDING_FLOAT16")),
+        base=base,
+    )
+
+
+class RateLimiter:
+    """Thread-safe limiter for requests and tokens per minute."""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        """Initialize the limiter.
+
+        Args:
+            requests_per_minute: Maximum number of requests per minute
+            tokens_per_minute: Maximum number of tokens per minute
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._request_budget = float(requests_per_minute)
+        self._token_budget = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int):
+        """Blocks until one request with the given number of tokens may be sent."""
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                elapsed_minutes = (now - self._updated) / 60
+                self._updated = now
+                self._request_budget = min(
+                    self.requests_per_minute,
+                    self._request_budget + elapsed_minutes * self.requests_per_minute,
+                )
+                self._token_budget = min(
+                    self.tokens_per_minute,
+                    self._token_budget + elapsed_minutes * self.tokens_per_minute,
+                )
+                if self._request_budget >= 1 and self._token_budget >= tokens:
+                    self._request_budget -= 1
+                    self._token_budget -= tokens
+                    return
+                missing = max(
+                    (1 - self._request_budget) / self.requests_per_minute,
+                    (tokens - self._token_budget) / self.tokens_per_minute,
+                )
+            time.sleep(max(missing * 60, 0.01))
+
+
+def pack_requests(
+    token_counts: List[int],
+    max_tokens_per_request: int = 300_000,
+    max_inputs_per_request: int = 2048,
+    max_tokens_per_text: int = 8191,
+) -> List[Tuple[List[int], int]]:
+    """Groups text indices into requests that respect the token and input limits.
+
+    Args:
+        token_counts: Number of tokens of each text
+        max_tokens_per_request: Token limit of a single embeddings request
+        max_inputs_per_request: Input limit of a single embeddings request
+        max_tokens_per_text: Context length of the embedding model
+
+    Returns:
+        List of (text indices, number of tokens), one per request
+
+    Raises:
+        ValueError: If a text is longer than the model's context length
+    """
+    requests, current, current_tokens = [], [], 0
+    for i, n_tokens in enumerate(token_counts):
+        if n_tokens > max_tokens_per_text:
+            raise ValueError(
+                f"Text {i} has {n_tokens} tokens, more than the model's "
+                f"limit of {max_tokens_per_text}"
+            )
+        if current and (
+            current_tokens + n_tokens > max_tokens_per_request
+            or len(current) >= max_inputs_per_request
+        ):
+            requests.append((current, current_tokens))
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += n_tokens
+    if current:
+        requests.append((current, current_tokens))
+    return requests
+
+
+class EmbeddingBatcher:
+    """Packs texts into token-budgeted requests and embeds them concurrently."""
+
+    def __init__(
+        self,
+        client: Optional[OpenAI] = None,
+        model: str = "text-embedding-3-large",
+        tokenizer: Optional[TiktokenTokenizer] = None,
+        max_tokens_per_text: int = 8191,
+        max_tokens_per_request: int = 300_000,
+        max_inputs_per_request: int = 2048,
+        max_concurrency: int = 4,
+        requests_per_minute: int = 3_000,
+        tokens_per_minute: int = 1_000_000,
+        max_retries: int = 6,
+        cache: Optional[EmbeddingCache] = None,
+        dimensions: Optional[int] = None,
+    ):
+        """Initialize the batcher.
+
+        Args:
+            client: OpenAI client (default: a new client from the environment)
+            model: Embedding model name
+            tokenizer: Tokenizer used to count tokens per text
+            max_tokens_per_text: Context length of the embedding model
+            max_tokens_per_request: Token limit of a single embeddings request
+            max_inputs_per_request: Input limit of a single embeddings request
+            max_concurrency: Number of requests in flight at once
+            requests_per_minute: Request rate limit of the account
+            tokens_per_minute: Token rate limit of the account
+            max_retries: Attempts per request before giving up
+            cache: Embedding cache consulted before sending texts to the API
+            dimensions: Shortened output dimensions (text-embedding-3 models),
+                None for the model's full size
+        """
+        self.client = client or OpenAI()
+        self.model = model
+        self.tokenizer = tokenizer or TiktokenTokenizer()
+        self.max_tokens_per_text = max_tokens_per_text
+        self.max_tokens_per_request = max_tokens_per_request
+        self.max_inputs_per_request = max_inputs_per_request
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.cache = cache
+        self.dimensions = dimensions
+        self.tokens = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _pack(self, texts: List[str]) -> List[Tuple[List[int], int]]:
+        """Groups text indices into requests that respect the token and input limits.
+
+        Requests are also kept small enough to give every one of the
+        `max_concurrency` workers a share of the texts, so a window that would
+        fit into a single request is still embedded by parallel requests.
+        """
+        token_counts = self.tokenizer.count_tokens_batch(texts) if texts else []
+        spread = max(self.max_concurrency, 1)
+        return pack_requests(
+            token_counts,
+            max_tokens_per_request=min(
+                self.max_tokens_per_request, max(-(-sum(token_counts) // spread), 1)
+            ),
+            max_inputs_per_request=min(
+                self.max_inputs_per_request, max(-(-len(texts) // spread), 1)
+            ),
+            max_tokens_per_text=self.max_tokens_per_text,
+        )
+
+    def _request(self, texts: List[str], n_tokens: int) -> List[List[float]]:
+        """Sends one embeddings request, retrying transient failures with backoff."""
+        for attempt in range(self.max_retries):
+            self.rate_limiter.acquire(n_tokens)
+            try:
+                options = {"dimensions": self.dimensions} if self.dimensions else {}
+                response = self.client.embeddings.create(
+                    model=self.model, input=texts, **options
+                )
+                return [item.embedding for item in response.data]
+            except RETRYABLE_ERRORS:
+                if attempt == self.max_retries - 1:
+                    raise
+                # Exponential backoff with full jitter
+                time.sleep(random.uniform(0, min(60, 2**attempt)))
+
+    def _lookup(self, texts: List[str]) -> Tuple[Dict[str, List[float]], List[str]]:
+        """Returns the cached embeddings of texts and the unique texts not cached."""
+        unique = list(dict.fromkeys(texts))
+        vectors = (
+            self.cache.get_many(self.model, self.dimensions, unique)
+            if self.cache
+            else {}
+        )
+        return vectors, [text for text in unique if text not in vectors]
+
+    def _store(self, computed: Dict[str, List[float]], n_tokens: int):
+        """Caches newly computed embeddings and counts the tokens sent for them."""
+        if self.cache and computed:
+            self.cache.put_many(self.model, self.dimensions, computed)
+        with self._lock:
+            self.tokens += n_tokens
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embeds texts, preserving their order.
+
+        Identical texts are embedded once, and texts found in the cache are not
+        sent to the API at all.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            One embedding per text
+        """
+        if not texts:
+            return []
+
+        start = time.perf_counter()
+        vectors, misses = self._lookup(texts)
+
+        requests = self._pack(misses)
+        computed = {}
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            futures = {
+                executor.submit(
+                    self._request, [misses[i] for i in indices], n_tokens
+                ): indices
+                for indices, n_tokens in requests
+            }
+            for future, indices in futures.items():
+                for i, embedding in zip(indices, future.result()):
+                    computed[misses[i]] = embedding
+
+        self._store(computed, sum(n_tokens for _, n_tokens in requests))
+        vectors.update(computed)
+
+        self.seconds += time.perf_counter() - start
+        return [vectors[text] for text in texts]
+
+    def embed_records(
+        self, records: Iterable[Dict[str, Any]], batch_size: int = 256
+    ) -> Iterator[Dict[str, Any]]:
+        """Adds a `vector` to each record, streaming records through concurrent requests.
+
+        Records are packed into requests of at most `batch_size` texts (and
+        `max_tokens_per_request` tokens) as they arrive. Up to `max_concurrency`
+        requests are in flight, and the records of a request are yielded as
+        soon as it and the requests before it completed, so only a few
+        requests' worth of records and vectors are held in memory at a time.
+
+        Args:
+            records: Rows with a `text` field, consumed lazily
+            batch_size: Maximum number of records per request, e.g. the batch
+                size of the table writes
+
+        Yields:
+            The records with their `vector` set, in their original order
+        """
+        start = time.perf_counter()
+        pending: Deque[Future] = deque()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                for batch, token_counts in self._batches(records, batch_size):
+                    pending.append(
+                        executor.submit(self._embed_batch, batch, token_counts)
+                    )
+                    if len(pending) >= self.max_concurrency:
+                        yield from pending.popleft().result()
+                while pending:
+                    yield from pending.popleft().result()
+        finally:
+            self.seconds += time.perf_counter() - start
+
+    def _batches(
+        self, records: Iterable[Dict[str, Any]], batch_size: int
+    ) -> Iterator[Tuple[List[Dict[str, Any]], List[int]]]:
+        """Groups records into requests within the limits, as the records arrive."""
+        max_inputs = min(batch_size, self.max_inputs_per_request)
+        batch, token_counts, batch_tokens = [], [], 0
+        for record in records:
+            n_tokens = self.tokenizer.count_tokens(record["text"])
+            if n_tokens > self.max_tokens_per_text:
+                raise ValueError(
+                    f"Text has {n_tokens} tokens, more than the model's "
+                    f"limit of {self.max_tokens_per_text}"
+                )
+            if batch and (
+                batch_tokens + n_tokens > self.max_tokens_per_request
+                or len(batch) >= max_inputs
+            ):
+                yield batch, token_counts
+                batch, token_counts, batch_tokens = [], [], 0
+            batch.append(record)
+            token_counts.append(n_tokens)
+            batch_tokens += n_tokens
+        if batch:
+            yield batch, token_counts
+
+    def _embed_batch(
+        self, batch: List[Dict[str, Any]], token_counts: List[int]
+    ) -> List[Dict[str, Any]]:
+        """Embeds the records of one request, skipping texts found in the cache."""
+        texts = [record["text"] for record in batch]
+        vectors, misses = self._lookup(texts)
+        if misses:
+            counts = dict(zip(texts, token_counts))
+            n_tokens = sum(counts[text] for text in misses)
+            computed = dict(zip(misses, self._request(misses, n_tokens)))
+            self._store(computed, n_tokens)
+            vectors.update(computed)
+        return [{**record, "vector": vectors[record["text"]]} for record in batch]
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.tokens / self.seconds if self.seconds else 0.0
+
+    def report(self) -> str:
+        """Returns a one-line summary of embedding throughput."""
+        return (
+            f"Embeddings: {self.tokens} tokens in {self.seconds:.1f}s "
+            f"({self.tokens_per_second:,.0f} tokens/s)"
+        )
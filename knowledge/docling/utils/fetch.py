@@ -0,0 +1,249 @@
+import asyncio
+import random
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+
+# Responses worth retrying: rate limited or a transient server error
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _host(url: str) -> str:
+    return urlparse(url).netloc.lower()
+
+
+class _HostRateLimiter:
+    """Hands out evenly spaced request slots for one host."""
+
+    def __init__(self, requests_per_second: float):
+        self.interval = 1 / requests_per_second
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Reserves the next slot and returns how long to wait for it, in seconds."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+            return slot - now
+
+
+class Fetcher:
+    """Shared HTTP layer for sitemaps and documents.
+
+    Requests go through pooled keep-alive connections, at most
+    `max_per_host` at a time and `requests_per_second` per host, and are
+    retried with jittered exponential backoff on connection errors, 429 and
+    5xx responses. Many hosts are fetched in parallel without hammering any
+    single one of them.
+
+    The concurrency cap applies to synchronous and asynchronous callers
+    separately; the rate limit is shared by both.
+    """
+
+    def __init__(
+        self,
+        max_per_host: int = 4,
+        requests_per_second: Optional[float] = 10,
+        max_connections: int = 64,
+        timeout: float = 30,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30,
+        headers: Optional[Dict[str, str]] = None,
+    ):
+        """Initialize the fetcher.
+
+        Args:
+            max_per_host: Maximum number of concurrent requests per host
+            requests_per_second: Maximum request rate per host, None to disable
+            max_connections: Maximum number of pooled connections over all hosts
+            timeout: Request timeout in seconds
+            max_retries: Number of retries after the first attempt
+            backoff: Base delay in seconds of the exponential backoff
+            max_backoff: Upper bound of a single backoff delay in seconds
+            headers: Headers sent with every request, e.g. a User-Agent
+        """
+        self.max_per_host = max_per_host
+        self.requests_per_second = requests_per_second
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retries = 0
+        self._client_options = dict(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            headers=headers,
+            follow_redirects=True,
+        )
+        self._lock = threading.Lock()
+        self._client: Optional[httpx.Client] = None
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._rate_limiters: Dict[str, _HostRateLimiter] = {}
+        # Async clients and semaphores are bound to the event loop that made them
+        self._async_state: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    @property
+    def client(self) -> httpx.Client:
+        """The pooled client used for synchronous requests."""
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(**self._client_options)
+            return self._client
+
+    def _semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._semaphores[host]
+
+    def _wait_for_slot(self, host: str) -> float:
+        """Returns the delay before the next request to a host may be sent."""
+        if self.requests_per_second is None:
+            return 0.0
+        with self._lock:
+            if host not in self._rate_limiters:
+                self._rate_limiters[host] = _HostRateLimiter(self.requests_per_second)
+            limiter = self._rate_limiters[host]
+        return limiter.reserve()
+
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        """Full-jitter exponential backoff, or the server's Retry-After if given."""
+        self.retries += 1
+        retry_after = response.headers.get("Retry-After") if response else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff)
+        return random.uniform(0, min(self.backoff * 2**attempt, self.max_backoff))
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        """Sends a GET request with per-host limits and retries.
+
+        Args:
+            url: URL to fetch
+            headers: Extra headers for this request, e.g. conditional GET validators
+
+        Returns:
+            The response of the last attempt. Call `raise_for_status` to turn a
+            final error status into an exception.
+
+        Raises:
+            httpx.TransportError: If the last attempt failed to connect or read
+        """
+        host = _host(url)
+        with self._semaphore(host):
+            for attempt in range(self.max_retries + 1):
+                time.sleep(self._wait_for_slot(host))
+                try:
+                    response = self.client.get(url, headers=headers)
+                except httpx.TransportError:
+                    if attempt == self.max_retries:
+                        raise
+                    time.sleep(self._retry_delay(attempt, None))
+                    continue
+                if (
+                    response.status_code in RETRY_STATUSES
+                    and attempt < self.max_retries
+                ):
+                    time.sleep(self._retry_delay(attempt, response))
+                    continue
+                return response
+
+    def _async_client(self, host: str) -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        """Returns the running loop's client and its semaphore for a host."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._async_state:
+                self._async_state[loop] = (
+                    httpx.AsyncClient(**self._client_options),
+                    {},
+                )
+            client, semaphores = self._async_state[loop]
+        if host not in semaphores:
+            semaphores[host] = asyncio.Semaphore(self.max_per_host)
+        return client, semaphores[host]
+
+    @asynccontextmanager
+    async def astream(
+        self, url: str, headers: Optional[Dict[str, str]] = None
+    ) -> AsyncIterator[httpx.Response]:
+        """Sends an async GET request and streams the response body.
+
+        Only the request is retried: once the response is handed out, errors
+        while reading the body propagate to the caller.
+
+        Args:
+            url: URL to fetch
+            headers: Extra headers for this request
+
+        Yields:
+            The response, with the body not read yet
+        """
+        host = _host(url)
+        client, semaphore = self._async_client(host)
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                await asyncio.sleep(self._wait_for_slot(host))
+                request = client.build_request("GET", url, headers=headers)
+                try:
+                    response = await client.send(request, stream=True)
+                except httpx.TransportError:
+                    if attempt == self.max_retries:
+                        raise
+                    await asyncio.sleep(self._retry_delay(attempt, None))
+                    continue
+                if (
+                    response.status_code in RETRY_STATUSES
+                    and attempt < self.max_retries
+                ):
+                    await response.aclose()
+                    await asyncio.sleep(self._retry_delay(attempt, response))
+                    continue
+                try:
+                    yield response
+                finally:
+                    await response.aclose()
+                return
+
+    async def aget(
+        self, url: str, headers: Optional[Dict[str, str]] = None
+    ) -> httpx.Response:
+        """Async version of `get`."""
+        async with self.astream(url, headers=headers) as response:
+            await response.aread()
+            return response
+
+    def close(self):
+        """Closes the pooled synchronous connections."""
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    async def aclose(self):
+        """Closes the pooled connections of the current event loop."""
+        with self._lock:
+            state = self._async_state.pop(asyncio.get_running_loop(), None)
+        if state is not None:
+            await state[0].aclose()
+
+
+_default_fetcher: Optional[Fetcher] = None
+_default_lock = threading.Lock()
+
+
+def get_fetcher() -> Fetcher:
+    """Returns the process-wide fetcher shared by the sitemap and conversion utilities."""
+    global _default_fetcher
+    with _default_lock:
+        if _default_fetcher is None:
+            _default_fetcher = Fetcher()
+        return _default_fetcher
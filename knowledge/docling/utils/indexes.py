@@ -0,0 +1,109 @@
+from typing import Dict, Optional, Set
+
+from lancedb.index import HnswSq, IvfPq
+
+# Scalar index type per filterable column: BTREE for high-cardinality values,
+# BITMAP for columns with few distinct values and LABEL_LIST for list columns
+SCALAR_INDEXES: Dict[str, str] = {
+    "doc_id": "BTREE",
+    "chunk_hash": "BTREE",
+    "filename": "BITMAP",
+    "title": "BTREE",
+    "page_numbers": "LABEL_LIST",
+}
+
+# Below this many rows a brute-force scan is exact and fast enough
+MIN_ROWS_FOR_VECTOR_INDEX = 10_000
+
+
+def indexed_columns(table) -> Set[str]:
+    """Returns the columns of a table that already have an index."""
+    return {column for index in table.list_indices() for column in index.columns}
+
+
+def create_scalar_indexes(
+    table, indexes: Dict[str, str] = SCALAR_INDEXES, replace: bool = False
+):
+    """Creates the scalar indexes used by filtered search and ingest.
+
+    With these indexes, `where` prefilters on metadata columns and the doc_id /
+    chunk_hash lookups of incremental ingest do not need to scan the table.
+    Existing indexes are kept; `table.optimize()` adds new rows to them.
+
+    Args:
+        table: LanceDB table
+        indexes: Mapping from column name to scalar index type
+        replace: Rebuild indexes that already exist
+    """
+    existing = set() if replace else indexed_columns(table)
+    for column, index_type in indexes.items():
+        if column not in existing:
+            table.create_scalar_index(column, index_type=index_type, replace=True)
+
+
+def create_fts_index(table, column: str = "text", replace: bool = False):
+    """Creates the full-text (BM25) index used by hybrid search.
+
+    An existing index is kept; `table.optimize()` adds new rows to it.
+
+    Args:
+        table: LanceDB table
+        column: Text column to index
+        replace: Rebuild the index if it already exists
+    """
+    if replace or column not in indexed_columns(table):
+        table.create_fts_index(column, replace=True)
+
+
+def create_vector_index(
+    table,
+    index_type: str = "IVF_PQ",
+    column: str = "vector",
+    distance_type: str = "l2",
+    num_partitions: Optional[int] = None,
+    num_sub_vectors: Optional[int] = None,
+    min_rows: int = MIN_ROWS_FOR_VECTOR_INDEX,
+    replace: bool = False,
+) -> bool:
+    """Creates the approximate nearest neighbour index on the vectors.
+
+    IVF_PQ is compact and fast to build; IVF_HNSW_SQ needs more memory but gives
+    higher recall at the same latency. Tune the index at query time with
+    `nprobes` / `refine_factor` (IVF) or `ef` (HNSW), see `utils.search`, and
+    pick the values with `python -m benchmarks.index_sweep`. An existing index
+    is kept; `table.optimize()` adds new rows to it.
+
+    Args:
+        table: LanceDB table
+        index_type: "IVF_PQ" or "IVF_HNSW_SQ"
+        column: Vector column to index
+        distance_type: Distance the index is built for; must match the queries
+        num_partitions: Number of IVF partitions (default: chosen by LanceDB
+            from the number of rows)
+        num_sub_vectors: Number of PQ sub-vectors (default: chosen by LanceDB
+            from the dimensions)
+        min_rows: Tables with fewer rows are left without a vector index
+        replace: Rebuild the index if it already exists, e.g. with another type
+
+    Returns:
+        True if the index was built, False if it already exists or the table is
+        too small to need one
+    """
+    if not replace and column in indexed_columns(table):
+        return False
+    if table.count_rows() < min_rows:
+        return False
+    if index_type == "IVF_PQ":
+        config = IvfPq(
+            distance_type=distance_type,
+            num_partitions=num_partitions,
+            num_sub_vectors=num_sub_vectors,
+        )
+    elif index_type == "IVF_HNSW_SQ":
+        config = HnswSq(distance_type=distance_type, num_partitions=num_partitions)
+    else:
+        raise ValueError(
+            f"Unknown index type {index_type!r}, expected IVF_PQ or IVF_HNSW_SQ"
+        )
+    table.create_index(column, config=config, replace=True)
+    return True
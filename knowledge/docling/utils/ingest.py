@@ -0,0 +1,294 @@
+import hashlib
+import json
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from docling_core.transforms.chunker import BaseChunk
+from docling_core.types.doc import DoclingDocument
+
+
+@dataclass
+class IngestReport:
+    """Number of chunks added, kept and removed by an ingestion run."""
+
+    added: int = 0
+    kept: int = 0
+    removed: int = 0
+
+    def __add__(self, other: "IngestReport") -> "IngestReport":
+        return IngestReport(
+            added=self.added + other.added,
+            kept=self.kept + other.kept,
+            removed=self.removed + other.removed,
+        )
+
+    def __str__(self) -> str:
+        return f"{self.added} added, {self.kept} kept, {self.removed} removed"
+
+
+def sql_quote(value: str) -> str:
+    """Quotes a string literal for a LanceDB filter expression."""
+    return "'" + value.replace("'", "''") + "'"
+
+
+def document_hash(document: DoclingDocument) -> str:
+    """Returns a content hash of a converted document."""
+    payload = json.dumps(document.export_to_dict(), sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def chunk_records(chunks: Iterable[BaseChunk]) -> Iterator[Dict[str, Any]]:
+    """Turns docling chunks into table rows with metadata and a content hash.
+
+    Args:
+        chunks: Chunks produced by a docling chunker
+
+    Yields:
+        Dictionaries with the text, metadata and chunk_hash of each chunk. The
+        metadata fields are also promoted to top-level columns so they can be
+        indexed and used as search prefilters.
+    """
+    for chunk in chunks:
+        metadata = {
+            "filename": chunk.meta.origin.filename,
+            "page_numbers": [
+                page_no
+                for page_no in sorted(
+                    set(
+                        prov.page_no
+                        for item in chunk.meta.doc_items
+                        for prov in item.prov
+                    )
+                )
+            ]
+            or None,
+            "title": chunk.meta.headings[0] if chunk.meta.headings else None,
+        }
+        payload = json.dumps({"text": chunk.text, "metadata": metadata}, sort_keys=True)
+        yield {
+            "text": chunk.text,
+            "metadata": metadata,
+            **metadata,
+            "chunk_hash": hashlib.sha256(payload.encode("utf-8")).hexdigest(),
+        }
+
+
+def create_chunk_table(db, name: str, schema):
+    """Opens a chunk table, creating it if it does not exist yet.
+
+    Args:
+        db: LanceDB connection
+        name: Table name
+        schema: LanceModel of the rows
+
+    Returns:
+        The table
+
+    Raises:
+        ValueError: If the table exists with another schema, e.g. because it
+            was built by an earlier version of the pipeline
+    """
+    try:
+        return db.create_table(name, schema=schema, exist_ok=True)
+    except ValueError:
+        existing = db.open_table(name).schema
+        expected = schema.to_arrow_schema()
+        differences = {
+            "missing columns": [
+                field.name for field in expected if field.name not in existing.names
+            ],
+            "changed columns": [
+                field.name
+                for field in expected
+                if field.name in existing.names
+                and existing.field(field.name).type != field.type
+            ],
+            "unexpected columns": [
+                column for column in existing.names if column not in expected.names
+            ],
+        }
+        details = "; ".join(
+            f"{label}: {', '.join(names)}"
+            for label, names in differences.items()
+            if names
+        )
+        if not details:
+            raise
+        raise ValueError(f"Table {name!r} has a different schema ({details})")
+
+
+def stream_to_table(
+    table,
+    rows: Iterable[Dict[str, Any]],
+    batch_size: int = 256,
+    max_pending_batches: int = 4,
+    on_batch: Optional[Callable[[int, int], None]] = None,
+) -> int:
+    """Writes rows to a table in fixed-size batches while they are being produced.
+
+    Rows are pulled lazily from `rows` and handed to a writer thread through a
+    bounded queue, so at most `max_pending_batches` batches are held in memory
+    and rows land in the table progressively.
+
+    Args:
+        table: LanceDB table to add the rows to
+        rows: Iterable of rows, typically a generator over a chunker
+        batch_size: Number of rows per `table.add` call
+        max_pending_batches: Batches that may wait for the writer before the
+            producer blocks
+        on_batch: Called with (batch number, number of rows) after each batch
+            was committed to the table
+
+    Returns:
+        Number of rows written
+
+    Raises:
+        RuntimeError: If a batch could not be written
+    """
+    batches: queue.Queue = queue.Queue(maxsize=max_pending_batches)
+    errors: List[Exception] = []
+    written = 0
+
+    def writer():
+        nonlocal written
+        batch_no = 0
+        while (batch := batches.get()) is not None:
+            if errors:
+                continue  # Keep draining so the producer never blocks forever
+            try:
+                table.add(batch)
+                written += len(batch)
+                if on_batch is not None:
+                    on_batch(batch_no, len(batch))
+                batch_no += 1
+            except Exception as e:
+                errors.append(e)
+
+    thread = threading.Thread(target=writer, daemon=True)
+    thread.start()
+
+    try:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                batches.put(batch)
+                batch = []
+            if errors:
+                break
+        if batch and not errors:
+            batches.put(batch)
+    finally:
+        batches.put(None)
+        thread.join()
+
+    if errors:
+        raise RuntimeError(f"Failed to write batch: {str(errors[0])}") from errors[0]
+    return written
+
+
+def _existing_rows(table, doc_id: str) -> List[Dict[str, Any]]:
+    return (
+        table.search()
+        .where(f"doc_id = {sql_quote(doc_id)}")
+        .select(["chunk_hash", "doc_hash"])
+        .limit(None)
+        .to_list()
+    )
+
+
+def sync_document(
+    table,
+    doc_id: str,
+    doc_hash: str,
+    records: Iterable[Dict[str, Any]],
+    batch_size: int = 256,
+    prepare: Optional[
+        Callable[[Iterable[Dict[str, Any]]], Iterable[Dict[str, Any]]]
+    ] = None,
+    on_batch: Optional[Callable[[int, int], None]] = None,
+) -> IngestReport:
+    """Brings the rows of one document in line with its current chunks.
+
+    Only chunks whose hash is not in the table yet are added (and therefore
+    embedded), and only rows for chunks that changed or disappeared are deleted.
+    If the document hash is unchanged, `records` is never consumed, so the
+    document does not even need to be chunked.
+
+    New rows are written with an empty doc_hash that is only set once every
+    chunk of the document was written. A sync that was interrupted therefore
+    never looks complete, and the next sync keeps the rows that made it into
+    the table and only adds the rest.
+
+    Args:
+        table: LanceDB table with doc_id, doc_hash and chunk_hash columns
+        doc_id: Stable identifier of the document, e.g. its URL
+        doc_hash: Content hash of the current version of the document
+        records: Rows as produced by `chunk_records`, consumed lazily
+        batch_size: Number of new rows per `table.add` call
+        prepare: Optional stage applied to the new rows before they are
+            written, e.g. near-duplicate filtering and
+            `EmbeddingBatcher.embed_records`. Rows without a `vector` are
+            embedded by the table's embedding function on `table.add`.
+        on_batch: Called with (batch number, number of rows) after each batch
+            of new rows was committed
+
+    Returns:
+        IngestReport for this document
+    """
+    existing = _existing_rows(table, doc_id)
+    if existing and all(row["doc_hash"] == doc_hash for row in existing):
+        return IngestReport(kept=len(existing))
+
+    existing_hashes = {row["chunk_hash"] for row in existing}
+    current_hashes = set()
+
+    def new_rows():
+        for record in records:
+            if record["chunk_hash"] in current_hashes:
+                continue
+            current_hashes.add(record["chunk_hash"])
+            if record["chunk_hash"] not in existing_hashes:
+                yield {**record, "doc_id": doc_id, "doc_hash": ""}
+
+    rows = new_rows()
+    if prepare is not None:
+        rows = prepare(rows)
+
+    # Stream new chunks into the table while the rest are still being chunked
+    added = stream_to_table(table, rows, batch_size=batch_size, on_batch=on_batch)
+
+    stale_hashes = existing_hashes - current_hashes
+    if stale_hashes:
+        hash_list = ", ".join(sql_quote(h) for h in sorted(stale_hashes))
+        table.delete(f"doc_id = {sql_quote(doc_id)} AND chunk_hash IN ({hash_list})")
+
+    kept = len(existing_hashes & current_hashes)
+    if added or kept:
+        # Every chunk is in the table: mark the new rows complete and point the
+        # unchanged ones at the new document version
+        table.update(
+            where=f"doc_id = {sql_quote(doc_id)}", values={"doc_hash": doc_hash}
+        )
+
+    return IngestReport(added=added, kept=kept, removed=len(stale_hashes))
+
+
+def remove_missing(table, doc_ids: Iterable[str]) -> IngestReport:
+    """Deletes the rows of every document that is no longer part of the corpus.
+
+    Args:
+        table: LanceDB table with a doc_id column
+        doc_ids: Identifiers of all documents in the current corpus
+
+    Returns:
+        IngestReport with the number of removed rows
+    """
+    id_list = ", ".join(sql_quote(doc_id) for doc_id in doc_ids)
+    where = f"doc_id NOT IN ({id_list})" if id_list else "true"
+    removed = table.count_rows(where)
+    if removed:
+        table.delete(where)
+    return IngestReport(removed=removed)
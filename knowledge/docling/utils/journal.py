@@ -0,0 +1,83 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+class IngestJournal:
+    """Durable record of the progress of an ingestion job in a SQLite file.
+
+    A job that is started again before it finished resumes where it stopped:
+    sources that were fully written are skipped. Rows already committed for a
+    partially written source are found in the table by `sync_document`, so
+    they are not tracked here. Starting a job that finished begins a new pass.
+    """
+
+    def __init__(
+        self, path: str = "data/ingest_journal.sqlite", job_id: str = "default"
+    ):
+        """Initialize the journal and start or resume the job.
+
+        Args:
+            path: SQLite file the journal is stored in
+            job_id: Identifier of the job, e.g. the name of a backfill
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.job_id = job_id
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._db:
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    started_at REAL NOT NULL,
+                    finished_at REAL
+                );
+                CREATE TABLE IF NOT EXISTS written (
+                    job_id TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    written_at REAL NOT NULL,
+                    PRIMARY KEY (job_id, source)
+                );
+                """)
+        self.resumed = self._start()
+
+    def _start(self) -> bool:
+        """Starts the job, or resumes it if it did not finish. Returns True on resume."""
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT finished_at FROM jobs WHERE job_id = ?", (self.job_id,)
+            ).fetchone()
+            if row is not None and row[0] is None:
+                return True
+            self._db.execute("DELETE FROM written WHERE job_id = ?", (self.job_id,))
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, NULL)",
+                (self.job_id, time.time()),
+            )
+            return False
+
+    def is_written(self, source: str) -> bool:
+        """Returns True if every chunk of a source was written in this job."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM written WHERE job_id = ? AND source = ?",
+                (self.job_id, source),
+            ).fetchone()
+        return row is not None
+
+    def mark_written(self, source: str):
+        """Records that every chunk of a source was written to the table."""
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO written VALUES (?, ?, ?)",
+                (self.job_id, source, time.time()),
+            )
+
+    def finish(self):
+        """Marks the job as finished, so the next start begins a new pass."""
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE jobs SET finished_at = ? WHERE job_id = ?",
+                (time.time(), self.job_id),
+            )
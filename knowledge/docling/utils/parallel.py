@@ -0,0 +1,390 @@
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+from multiprocessing.connection import Connection
+from multiprocessing.connection import wait as wait_for_any
+from typing import Deque, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+import pypdfium2
+
+from docling.datamodel.base_models import DocumentStream, InputFormat
+from docling.document_converter import DocumentConverter
+from docling_core.types.doc import DoclingDocument
+
+from utils.cache import read_source
+from utils.fetch import Fetcher, get_fetcher
+from utils.profiles import AdaptiveConverter
+
+PageRange = Tuple[int, int]
+
+# Each worker process keeps one warm converter (models loaded once per process)
+_converter: Optional[Union[DocumentConverter, AdaptiveConverter]] = None
+
+
+@dataclass
+class ConversionOutcome:
+    """Result of converting a single source in a worker process."""
+
+    source: str
+    page_range: Optional[PageRange] = None
+    document: Optional[DoclingDocument] = None
+    error: Optional[str] = None
+    seconds: float = 0.0
+    profile: Optional[str] = None  # Pipeline profile that ran, when adaptive
+
+    @property
+    def ok(self) -> bool:
+        return self.document is not None
+
+
+class _Task(NamedTuple):
+    """A conversion to run in a worker, with the source bytes if already downloaded."""
+
+    source: str
+    page_range: Optional[PageRange] = None
+    content: Optional[Tuple[str, bytes]] = None
+    error: Optional[str] = None
+
+
+def _init_worker(adaptive: bool):
+    """Create the per-process converter and load its models up front."""
+    global _converter
+    if adaptive:
+        _converter = AdaptiveConverter()
+        for converter in _converter.converters.values():
+            converter.initialize_pipeline(InputFormat.PDF)
+    else:
+        _converter = DocumentConverter()
+        _converter.initialize_pipeline(InputFormat.PDF)
+
+
+def _convert_one(
+    source: str,
+    page_range: Optional[PageRange],
+    content: Optional[Tuple[str, bytes]] = None,
+) -> ConversionOutcome:
+    """Convert a single source (or a page range of it) inside a worker, never raising."""
+    start = time.perf_counter()
+    try:
+        if content is not None:
+            name, data = content
+            source_input = DocumentStream(name=name, stream=BytesIO(data))
+        else:
+            source_input = source
+        kwargs = {"page_range": page_range} if page_range else {}
+        profile = None
+        if isinstance(_converter, AdaptiveConverter):
+            result, input_profile = _converter.convert_with_profile(
+                source_input, **kwargs
+            )
+            profile = input_profile.name
+        else:
+            result = _converter.convert(source_input, **kwargs)
+        return ConversionOutcome(
+            source=source,
+            page_range=page_range,
+            document=result.document,
+            seconds=time.perf_counter() - start,
+            profile=profile,
+        )
+    except Exception as e:
+        return ConversionOutcome(
+            source=source,
+            page_range=page_range,
+            error=f"{type(e).__name__}: {str(e)}",
+            seconds=time.perf_counter() - start,
+        )
+
+
+def _work(conn: Connection, adaptive: bool, max_tasks: Optional[int]):
+    """Worker process: loads the models once, then converts the tasks it is sent."""
+    _init_worker(adaptive)
+    done = 0
+    while max_tasks is None or done < max_tasks:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        conn.send(_convert_one(*task))
+        done += 1
+
+
+class _Worker:
+    """A worker process with a warm converter that runs one task at a time.
+
+    Each worker has its own pipe, so the parent knows which task every process
+    is running and can stop one stuck or crashed worker without touching the
+    others.
+    """
+
+    def __init__(self, context, adaptive: bool, max_tasks: Optional[int]):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_work, args=(child_conn, adaptive, max_tasks)
+        )
+        self.process.start()
+        child_conn.close()
+        self.task: Optional[_Task] = None
+        self.retry = False  # The task already crashed another worker
+        self.started = 0.0
+        self.done = 0
+
+    def submit(self, task: _Task, retry: bool = False):
+        self.task, self.retry, self.started = task, retry, time.monotonic()
+        try:
+            self.conn.send((task.source, task.page_range, task.content))
+        except OSError:
+            pass  # The process died; the parent sees its sentinel and retries
+
+    def stop(self, kill: bool = False):
+        """Stops the process: killed if it may be stuck, else asked to exit."""
+        if not kill:
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+            self.process.join(timeout=10)
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+def _run_pool(
+    tasks: Iterable[_Task],
+    max_workers: int,
+    timeout: Optional[int],
+    max_tasks_per_child: Optional[int],
+    adaptive: bool = False,
+) -> Iterator[ConversionOutcome]:
+    """Runs tasks on worker processes, yielding their outcomes as they finish.
+
+    A task that overruns the timeout only costs its own worker, which is
+    killed and replaced: the other workers keep their loaded models and their
+    documents in flight. A task whose worker dies (e.g. segfault or OOM kill)
+    is retried once on a fresh worker, and reported as crashed only if it
+    takes that one down too.
+    """
+    context = multiprocessing.get_context()
+    tasks = iter(tasks)
+    retries: Deque[_Task] = deque()
+    workers: List[_Worker] = []
+    try:
+        while True:
+            # Give every idle worker a task, starting workers up to max_workers.
+            # Only one task per worker is in flight, so a task's clock starts
+            # when its worker gets it (for a new worker it also covers loading
+            # the models)
+            while True:
+                for worker in [w for w in workers if w.task is None]:
+                    if not worker.process.is_alive():  # Died while idle
+                        worker.stop()
+                        workers.remove(worker)
+                idle = next((w for w in workers if w.task is None), None)
+                if idle is None and len(workers) >= max_workers:
+                    break
+                retry = bool(retries)
+                task = retries.popleft() if retry else next(tasks, None)
+                if task is None:
+                    break
+                if task.error:
+                    yield ConversionOutcome(
+                        source=task.source, page_range=task.page_range, error=task.error
+                    )
+                    continue
+                if idle is None:
+                    idle = _Worker(context, adaptive, max_tasks_per_child)
+                    workers.append(idle)
+                idle.submit(task, retry=retry)
+
+            busy = [worker for worker in workers if worker.task is not None]
+            if not busy:
+                return
+
+            wait_seconds = None
+            if timeout:
+                oldest = min(worker.started for worker in busy)
+                wait_seconds = max(oldest + timeout - time.monotonic(), 0)
+            wait_for_any(
+                [worker.conn for worker in busy]
+                + [worker.process.sentinel for worker in busy],
+                timeout=wait_seconds,
+            )
+
+            now = time.monotonic()
+            for worker in busy:
+                task = worker.task
+                if worker.conn.poll():
+                    try:
+                        outcome = worker.conn.recv()
+                    except EOFError:  # The process is exiting
+                        outcome = None
+                        worker.process.join()
+                    if outcome is not None:
+                        worker.task = None
+                        worker.done += 1
+                        if max_tasks_per_child and worker.done >= max_tasks_per_child:
+                            worker.stop()  # Recycled: it exits on its own
+                            workers.remove(worker)
+                        yield outcome
+                        continue
+
+                if not worker.process.is_alive():
+                    exitcode = worker.process.exitcode
+                    worker.stop()
+                    workers.remove(worker)
+                    if worker.retry:
+                        yield ConversionOutcome(
+                            source=task.source,
+                            page_range=task.page_range,
+                            error=f"Worker process crashed (exit code {exitcode})",
+                        )
+                    else:
+                        retries.append(task)
+                elif timeout and now - worker.started >= timeout:
+                    # Stuck, e.g. in native parsing code: only this worker goes
+                    worker.stop(kill=True)
+                    workers.remove(worker)
+                    yield ConversionOutcome(
+                        source=task.source,
+                        page_range=task.page_range,
+                        error=f"Timed out after {timeout}s",
+                        seconds=now - worker.started,
+                    )
+    finally:
+        for worker in workers:
+            worker.stop(kill=worker.task is not None)
+
+
+def _download(source: str, fetcher: Fetcher) -> _Task:
+    """Downloads a URL source in the parent process; local files are left to workers."""
+    if os.path.exists(source):
+        return _Task(source)
+    try:
+        return _Task(source, content=read_source(source, fetcher))
+    except Exception as e:
+        return _Task(source, error=f"Download failed: {type(e).__name__}: {str(e)}")
+
+
+def _download_all(
+    sources: Iterable[str], fetcher: Fetcher, max_downloads: int
+) -> Iterator[_Task]:
+    """Downloads sources in a thread pool, keeping a bounded number in flight."""
+    with ThreadPoolExecutor(max_workers=max_downloads) as pool:
+        futures = deque()
+        for source in sources:
+            futures.append(pool.submit(_download, source, fetcher))
+            if len(futures) >= 2 * max_downloads:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+
+
+def convert_parallel(
+    sources: Iterable[str],
+    max_workers: Optional[int] = None,
+    timeout: Optional[int] = 300,
+    max_tasks_per_child: Optional[int] = None,
+    fetcher: Optional[Fetcher] = None,
+    max_downloads: int = 16,
+    adaptive: bool = False,
+) -> Iterator[ConversionOutcome]:
+    """Converts sources in a pool of worker processes, yielding results as they finish.
+
+    URLs are downloaded in this process through one shared fetcher, so the
+    per-host concurrency and rate limits hold across all workers and
+    connections are reused, while the workers only convert.
+
+    Args:
+        sources: URLs or file paths to convert
+        max_workers: Number of worker processes (default: number of CPUs)
+        timeout: Per-document timeout in seconds, None to disable. Enforced by
+            this process, which kills and replaces only the worker of a
+            document that overruns
+        max_tasks_per_child: Recycle a worker after this many documents to cap
+            memory growth (default: never)
+        fetcher: Fetch layer for URLs (default: the shared process-wide fetcher)
+        max_downloads: Number of downloads in flight at once, over all hosts
+        adaptive: Pick the fast or full pipeline profile per document (see
+            AdaptiveConverter) and report it in `profile`
+
+    Yields:
+        A ConversionOutcome per source, in completion order. Failed downloads,
+        failed, timed out and crashed conversions are reported through `error`
+        instead of raising.
+    """
+    tasks = _download_all(sources, fetcher or get_fetcher(), max_downloads)
+    max_workers = max_workers or os.cpu_count() or 1
+    yield from _run_pool(tasks, max_workers, timeout, max_tasks_per_child, adaptive)
+
+
+def page_ranges(n_pages: int, pages_per_shard: int) -> List[PageRange]:
+    """Splits pages 1..n_pages into consecutive inclusive ranges."""
+    return [
+        (start, min(start + pages_per_shard - 1, n_pages))
+        for start in range(1, n_pages + 1, pages_per_shard)
+    ]
+
+
+def convert_sharded(
+    source: str,
+    pages_per_shard: int = 16,
+    max_workers: Optional[int] = None,
+    timeout: Optional[int] = 300,
+) -> DoclingDocument:
+    """Converts a large PDF by converting page ranges in parallel and stitching them.
+
+    Page numbers in the provenance of the stitched document are the page numbers
+    of the original PDF, so `prov.page_no` of chunk items stays correct.
+
+    Args:
+        source: File path or URL of a PDF
+        pages_per_shard: Number of pages converted per worker task
+        max_workers: Number of worker processes (default: number of CPUs)
+        timeout: Per-shard timeout in seconds, None to disable
+
+    Returns:
+        The converted document
+
+    Raises:
+        RuntimeError: If any shard failed to convert
+    """
+    name, content = read_source(source)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Workers read the PDF from disk instead of downloading it once per shard
+        path = os.path.join(tmp_dir, name if name.endswith(".pdf") else f"{name}.pdf")
+        with open(path, "wb") as f:
+            f.write(content)
+
+        pdf = pypdfium2.PdfDocument(path)
+        n_pages = len(pdf)
+        pdf.close()
+
+        tasks = [
+            _Task(path, page_range)
+            for page_range in page_ranges(n_pages, pages_per_shard)
+        ]
+        max_workers = min(max_workers or os.cpu_count() or 1, len(tasks)) or 1
+        outcomes = list(_run_pool(tasks, max_workers, timeout, None))
+
+    failed = [outcome for outcome in outcomes if not outcome.ok]
+    if failed:
+        details = ", ".join(f"pages {o.page_range}: {o.error}" for o in failed)
+        raise RuntimeError(f"Failed to convert {source}: {details}")
+
+    # Concatenate in page order: consecutive ranges keep their page numbers
+    shards = sorted(outcomes, key=lambda outcome: outcome.page_range[0])
+    document = DoclingDocument.concatenate([shard.document for shard in shards])
+    document.origin = shards[0].document.origin
+
+    expected_pages = {page_no for shard in shards for page_no in shard.document.pages}
+    if set(document.pages) != expected_pages:
+        raise RuntimeError(f"Page numbers of {source} changed while stitching shards")
+    return document
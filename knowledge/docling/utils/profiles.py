@@ -0,0 +1,212 @@
+import json
+from collections import Counter
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, Tuple, Union
+
+import pypdfium2
+from docling.datamodel.base_models import DocumentStream, InputFormat
+from docling.datamodel.document import ConversionResult
+from docling.datamodel.pipeline_options import PdfPipelineOptions
+from docling.document_converter import DocumentConverter, PdfFormatOption
+
+from utils.cache import options_fingerprint, read_source
+
+FAST = "fast"
+FULL = "full"
+
+_IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp"}
+
+
+@dataclass
+class InputProfile:
+    """The pipeline profile chosen for an input and the evidence it was based on."""
+
+    name: str
+    reason: str
+    pages: int = 0
+    sampled_pages: int = 0
+    text_pages: int = 0
+    image_coverage: float = 0.0
+
+
+def fast_pipeline_options() -> PdfPipelineOptions:
+    """Pipeline options for born-digital PDFs: no OCR and no table-structure model.
+
+    Text comes from the PDF's text layer and tables are kept as laid-out text.
+    """
+    return PdfPipelineOptions(do_ocr=False, do_table_structure=False)
+
+
+def _sample(n_pages: int, sample_pages: int) -> range:
+    """Evenly spaced page indices, at most sample_pages of them."""
+    step = max(n_pages // sample_pages, 1)
+    return range(0, n_pages, step)[:sample_pages]
+
+
+def classify_pdf(
+    content: bytes,
+    min_chars_per_page: int = 32,
+    max_image_coverage: float = 0.5,
+    sample_pages: int = 8,
+) -> InputProfile:
+    """Picks the fast profile for PDFs with a text layer and few images.
+
+    Args:
+        content: The PDF bytes
+        min_chars_per_page: Characters a page's text layer needs to count as text
+        max_image_coverage: Mean fraction of the page area covered by images above
+            which OCR may be needed (e.g. scans with a partial text layer)
+        sample_pages: Number of evenly spaced pages inspected
+
+    Returns:
+        The chosen InputProfile
+    """
+    pdf = pypdfium2.PdfDocument(content)
+    try:
+        n_pages = len(pdf)
+        text_pages, coverage = 0, 0.0
+        sampled = _sample(n_pages, sample_pages)
+        for index in sampled:
+            page = pdf[index]
+            textpage = page.get_textpage()
+            if len(textpage.get_text_range().strip()) >= min_chars_per_page:
+                text_pages += 1
+            textpage.close()
+
+            width, height = page.get_size()
+            image_area = 0.0
+            for image in page.get_objects(
+                filter=(pypdfium2.raw.FPDF_PAGEOBJ_IMAGE,), max_depth=2
+            ):
+                left, bottom, right, top = image.get_pos()
+                image_area += max(right - left, 0) * max(top - bottom, 0)
+            coverage += min(image_area / (width * height), 1.0) if width else 0.0
+            page.close()
+    finally:
+        pdf.close()
+
+    profile = InputProfile(
+        name=FAST,
+        reason="text layer on every sampled page",
+        pages=n_pages,
+        sampled_pages=len(sampled),
+        text_pages=text_pages,
+        image_coverage=coverage / len(sampled) if sampled else 0.0,
+    )
+    if text_pages < len(sampled):
+        profile.name = FULL
+        profile.reason = (
+            f"{len(sampled) - text_pages} of {len(sampled)} sampled pages "
+            "have no text layer"
+        )
+    elif profile.image_coverage > max_image_coverage:
+        profile.name = FULL
+        profile.reason = f"images cover {profile.image_coverage:.0%} of the pages"
+    return profile
+
+
+def classify_input(name: str, content: bytes, **thresholds) -> InputProfile:
+    """Picks the pipeline profile for any input docling supports.
+
+    Args:
+        name: File name of the input, used to detect its format
+        content: The input bytes
+        **thresholds: Passed on to `classify_pdf`
+
+    Returns:
+        The chosen InputProfile
+    """
+    if content.startswith(b"%PDF"):
+        return classify_pdf(content, **thresholds)
+    if Path(name).suffix.lower() in _IMAGE_EXTENSIONS:
+        return InputProfile(name=FULL, reason="image input needs OCR")
+    # HTML, Markdown, Office formats, ... do not run the PDF pipeline at all
+    return InputProfile(name=FAST, reason="not a PDF or image")
+
+
+class AdaptiveConverter:
+    """Converts each input with the fast or the full pipeline profile.
+
+    Born-digital PDFs and HTML skip OCR and the table-structure model; scanned
+    and image-heavy inputs get the full pipeline. Drop-in for
+    `DocumentConverter.convert`, so it works with ConversionCache.
+    """
+
+    def __init__(
+        self,
+        min_chars_per_page: int = 32,
+        max_image_coverage: float = 0.5,
+        sample_pages: int = 8,
+    ):
+        """Initialize both profiles.
+
+        Args:
+            min_chars_per_page: Characters a page's text layer needs to count as text
+            max_image_coverage: Mean image coverage above which a PDF gets the full
+                profile
+            sample_pages: Number of evenly spaced pages inspected per PDF
+        """
+        self.thresholds = dict(
+            min_chars_per_page=min_chars_per_page,
+            max_image_coverage=max_image_coverage,
+            sample_pages=sample_pages,
+        )
+        self.converters: Dict[str, DocumentConverter] = {
+            FAST: DocumentConverter(
+                format_options={
+                    InputFormat.PDF: PdfFormatOption(
+                        pipeline_options=fast_pipeline_options()
+                    )
+                }
+            ),
+            FULL: DocumentConverter(),
+        }
+        self.counts: Counter = Counter()
+
+    def fingerprint(self) -> str:
+        """Describes both profiles and the thresholds, for cache keys."""
+        return json.dumps(
+            {
+                "thresholds": self.thresholds,
+                **{
+                    name: json.loads(options_fingerprint(converter))
+                    for name, converter in self.converters.items()
+                },
+            },
+            sort_keys=True,
+        )
+
+    def convert_with_profile(
+        self, source: Union[str, DocumentStream], **kwargs
+    ) -> Tuple[ConversionResult, InputProfile]:
+        """Classifies a source, then converts it with the chosen profile.
+
+        Args:
+            source: A file path, URL or DocumentStream
+            **kwargs: Passed on to `DocumentConverter.convert`, e.g. page_range
+
+        Returns:
+            Tuple of (conversion result, profile that ran)
+        """
+        if isinstance(source, DocumentStream):
+            name, content = source.name, source.stream.read()
+        else:
+            name, content = read_source(str(source))
+
+        profile = classify_input(name, content, **self.thresholds)
+        self.counts[profile.name] += 1
+        result = self.converters[profile.name].convert(
+            DocumentStream(name=name, stream=BytesIO(content)), **kwargs
+        )
+        return result, profile
+
+    def convert(self, source: Union[str, DocumentStream], **kwargs) -> ConversionResult:
+        """Converts a source with the profile it is classified as."""
+        result, _ = self.convert_with_profile(source, **kwargs)
+        return result
+
+    def report(self) -> str:
+        """Returns a one-line summary of how often each profile ran."""
+        return f"Pipeline profiles: {self.counts[FAST]} fast, {self.counts[FULL]} full"
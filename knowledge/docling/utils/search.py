@@ -0,0 +1,335 @@
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import pandas as pd
+
+from utils.embeddings import QueryEmbeddingCache, get_query_cache
+from utils.ingest import sql_quote
+
+# Damping constant of reciprocal rank fusion; 60 is the value from the original
+# paper and works well without tuning
+RRF_K = 60
+
+
+def build_filter(
+    doc_id: Optional[str] = None,
+    filename: Optional[str] = None,
+    title: Optional[str] = None,
+    pages: Optional[List[int]] = None,
+) -> Optional[str]:
+    """Builds a LanceDB filter expression from metadata constraints.
+
+    Args:
+        doc_id: Only chunks of this document (source URL)
+        filename: Only chunks from this file
+        title: Only chunks from this section
+        pages: Only chunks on any of these pages
+
+    Returns:
+        SQL filter expression, or None if no constraint was given
+    """
+    clauses = []
+    if doc_id is not None:
+        clauses.append(f"doc_id = {sql_quote(doc_id)}")
+    if filename is not None:
+        clauses.append(f"filename = {sql_quote(filename)}")
+    if title is not None:
+        clauses.append(f"title = {sql_quote(title)}")
+    if pages:
+        page_list = ", ".join(str(int(page)) for page in pages)
+        clauses.append(f"array_has_any(page_numbers, [{page_list}])")
+    return " AND ".join(clauses) or None
+
+
+def embed_query(
+    table, query: str, cache: Optional[QueryEmbeddingCache] = None
+) -> List[float]:
+    """Embeds a query with the table's embedding function, through the query cache.
+
+    Args:
+        table: LanceDB table whose `vector` column has an embedding function
+        query: Search query
+        cache: Query embedding cache (default: the process-wide cache)
+
+    Returns:
+        The query embedding, to pass to `table.search`
+    """
+    func = table.embedding_functions["vector"].function
+    return (cache or get_query_cache()).embed(func, query)
+
+
+def embed_queries(
+    table, queries: List[str], cache: Optional[QueryEmbeddingCache] = None
+) -> List[List[float]]:
+    """Embeds many queries at once; misses are sent in as few requests as possible.
+
+    Args:
+        table: LanceDB table whose `vector` column has an embedding function
+        queries: Search queries
+        cache: Query embedding cache (default: the process-wide cache)
+
+    Returns:
+        One embedding per query
+    """
+    func = table.embedding_functions["vector"].function
+    return (cache or get_query_cache()).embed_many(func, queries)
+
+
+def tune_vector_query(
+    builder,
+    nprobes: Optional[int] = None,
+    refine_factor: Optional[int] = None,
+    ef: Optional[int] = None,
+    exact: bool = False,
+):
+    """Applies the vector index knobs to a LanceDB vector query.
+
+    Args:
+        builder: LanceDB vector query builder
+        nprobes: Number of IVF partitions searched; more is slower but finds more
+            true neighbours
+        refine_factor: Re-rank `limit * refine_factor` candidates with the full
+            vectors, undoing most of the PQ quantization error
+        ef: Size of the HNSW candidate list (IVF_HNSW_SQ indexes)
+        exact: Skip the index and scan all vectors
+
+    Returns:
+        The builder
+    """
+    if exact:
+        return builder.bypass_vector_index()
+    if nprobes is not None:
+        builder = builder.nprobes(nprobes)
+    if refine_factor is not None:
+        builder = builder.refine_factor(refine_factor)
+    if ef is not None:
+        builder = builder.ef(ef)
+    return builder
+
+
+def search(
+    table,
+    query: str,
+    limit: int = 5,
+    doc_id: Optional[str] = None,
+    filename: Optional[str] = None,
+    title: Optional[str] = None,
+    pages: Optional[List[int]] = None,
+    nprobes: Optional[int] = None,
+    refine_factor: Optional[int] = None,
+    ef: Optional[int] = None,
+    exact: bool = False,
+    query_cache: Optional[QueryEmbeddingCache] = None,
+) -> pd.DataFrame:
+    """Vector search, optionally scoped to a document, file, section or pages.
+
+    Metadata constraints are applied as a prefilter (using the scalar indexes)
+    before the nearest neighbour search, so scoped queries return `limit`
+    results from the scope and stay fast as the table grows.
+
+    Args:
+        table: LanceDB table
+        query: Search query, embedded with the table's embedding function (see
+            `embed_query`)
+        limit: Number of results to return
+        doc_id: Only chunks of this document (source URL)
+        filename: Only chunks from this file
+        title: Only chunks from this section
+        pages: Only chunks on any of these pages
+        nprobes: IVF partitions searched (see `tune_vector_query`)
+        refine_factor: Re-ranking factor for PQ indexes (see `tune_vector_query`)
+        ef: HNSW candidate list size (see `tune_vector_query`)
+        exact: Skip the vector index and return the exact nearest neighbours
+        query_cache: Query embedding cache (default: the process-wide cache)
+
+    Returns:
+        DataFrame with the matching chunks and their distance
+    """
+    vector = embed_query(table, query, query_cache)
+    builder = table.search(vector, query_type="vector").limit(limit)
+    builder = tune_vector_query(builder, nprobes, refine_factor, ef, exact)
+    where = build_filter(doc_id=doc_id, filename=filename, title=title, pages=pages)
+    if where:
+        builder = builder.where(where, prefilter=True)
+    return builder.to_pandas()
+
+
+def batch_search(
+    table,
+    queries: List[str],
+    limit: int = 5,
+    doc_id: Optional[str] = None,
+    filename: Optional[str] = None,
+    title: Optional[str] = None,
+    pages: Optional[List[int]] = None,
+    nprobes: Optional[int] = None,
+    refine_factor: Optional[int] = None,
+    ef: Optional[int] = None,
+    exact: bool = False,
+    query_cache: Optional[QueryEmbeddingCache] = None,
+) -> List[pd.DataFrame]:
+    """Vector search for many queries at once, e.g. an evaluation set or
+    sub-queries fanned out from one question.
+
+    All queries are embedded together and searched in one multi-vector query,
+    so the table (or index) is scanned once for the whole batch instead of once
+    per query. Takes the same scope and tuning arguments as `search`, applied
+    to every query.
+
+    Args:
+        table: LanceDB table
+        queries: Search queries
+        limit: Number of results per query
+        doc_id: Only chunks of this document (source URL)
+        filename: Only chunks from this file
+        title: Only chunks from this section
+        pages: Only chunks on any of these pages
+        nprobes: IVF partitions searched (see `tune_vector_query`)
+        refine_factor: Re-ranking factor for PQ indexes (see `tune_vector_query`)
+        ef: HNSW candidate list size (see `tune_vector_query`)
+        exact: Skip the vector index and return the exact nearest neighbours
+        query_cache: Query embedding cache (default: the process-wide cache)
+
+    Returns:
+        One DataFrame per query, in the order of `queries`, with the matching
+        chunks and their distance
+    """
+    if not queries:
+        return []
+
+    vectors = embed_queries(table, queries, query_cache)
+    builder = table.search(vectors, query_type="vector").limit(limit)
+    builder = tune_vector_query(builder, nprobes, refine_factor, ef, exact)
+    where = build_filter(doc_id=doc_id, filename=filename, title=title, pages=pages)
+    if where:
+        builder = builder.where(where, prefilter=True)
+    frame = builder.to_pandas()
+    if "query_index" not in frame.columns:  # A single query is not tagged
+        return [frame]
+
+    # Results of all queries come back together, tagged with the query's index
+    groups = {
+        index: group.drop(columns="query_index").reset_index(drop=True)
+        for index, group in frame.groupby("query_index", sort=False)
+    }
+    empty = frame.drop(columns="query_index").iloc[0:0]
+    return [groups.get(index, empty) for index in range(len(queries))]
+
+
+def reciprocal_rank_fusion(
+    rankings: List[List[Hashable]], k: int = RRF_K
+) -> List[Tuple[Hashable, float]]:
+    """Fuses ranked lists by summing 1 / (k + rank) over the lists an item is in.
+
+    Args:
+        rankings: Ranked lists of item keys, best first
+        k: Damping constant; larger values flatten the contribution of top ranks
+
+    Returns:
+        (key, score) pairs, best first
+    """
+    scores: Dict[Hashable, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] += 1 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def hybrid_search(
+    table,
+    query: str,
+    limit: int = 5,
+    candidates: int = 20,
+    rrf_k: int = RRF_K,
+    doc_id: Optional[str] = None,
+    filename: Optional[str] = None,
+    title: Optional[str] = None,
+    pages: Optional[List[int]] = None,
+    nprobes: Optional[int] = None,
+    refine_factor: Optional[int] = None,
+    ef: Optional[int] = None,
+    query_cache: Optional[QueryEmbeddingCache] = None,
+) -> pd.DataFrame:
+    """Full-text (BM25) and vector search run together and fused by rank.
+
+    Lexical search finds exact identifiers, section numbers and product names
+    that embeddings blur; vector search finds paraphrases. Both retrievers run
+    concurrently with the same metadata prefilter and their rankings are merged
+    with reciprocal rank fusion. Requires the full-text index on `text` (see
+    `utils.indexes.create_fts_index`).
+
+    Args:
+        table: LanceDB table
+        query: Search query
+        limit: Number of fused results to return
+        candidates: Number of results fetched from each retriever
+        rrf_k: Damping constant of reciprocal rank fusion
+        doc_id: Only chunks of this document (source URL)
+        filename: Only chunks from this file
+        title: Only chunks from this section
+        pages: Only chunks on any of these pages
+        nprobes: IVF partitions searched (see `tune_vector_query`)
+        refine_factor: Re-ranking factor for PQ indexes (see `tune_vector_query`)
+        ef: HNSW candidate list size (see `tune_vector_query`)
+        query_cache: Query embedding cache (default: the process-wide cache)
+
+    Returns:
+        DataFrame with the fused chunks, their rank in each retriever (None if
+        not retrieved by it) and `_relevance_score`. The latency of each
+        retriever in milliseconds is in `result.attrs["latency_ms"]`; the
+        vector latency includes embedding the query (or the cache lookup).
+    """
+    where = build_filter(doc_id=doc_id, filename=filename, title=title, pages=pages)
+
+    def retrieve(query_type: str) -> Tuple[pd.DataFrame, float]:
+        start = time.perf_counter()
+        if query_type == "vector":
+            vector = embed_query(table, query, query_cache)
+            builder = table.search(vector, query_type="vector").limit(candidates)
+            builder = tune_vector_query(builder, nprobes, refine_factor, ef)
+        else:
+            builder = table.search(query, query_type="fts").limit(candidates)
+        if where:
+            builder = builder.where(where, prefilter=True)
+        return builder.to_pandas(), (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = {name: pool.submit(retrieve, name) for name in ("vector", "fts")}
+        results = {name: future.result() for name, future in futures.items()}
+
+    rows: Dict[Tuple[str, str], dict] = {}
+    ranks: Dict[str, Dict[Tuple[str, str], int]] = {}
+    for name, (frame, _) in results.items():
+        ranking = {}
+        for rank, row in enumerate(frame.to_dict("records"), start=1):
+            key = (row["doc_id"], row["chunk_hash"])
+            ranking[key] = rank
+            # Keep the columns of both retrievers (_distance and _score)
+            rows.setdefault(key, {}).update(row)
+        ranks[name] = ranking
+
+    fused = reciprocal_rank_fusion([list(ranking) for ranking in ranks.values()], rrf_k)
+    # Columns of both retrievers, so the frame keeps them even with no results
+    columns = [*results["vector"][0].columns, *results["fts"][0].columns]
+    columns += ["vector_rank", "fts_rank", "_relevance_score"]
+    result = pd.DataFrame(
+        [
+            {
+                **rows[key],
+                "vector_rank": ranks["vector"].get(key),
+                "fts_rank": ranks["fts"].get(key),
+                "_relevance_score": score,
+            }
+            for key, score in fused[:limit]
+        ],
+        columns=list(dict.fromkeys(columns)),
+    )
+    result.attrs["latency_ms"] = {
+        "vector": results["vector"][1],
+        "fts": results["fts"][1],
+        "total": (time.perf_counter() - start) * 1000,
+    }
+    return result
@@ -0,0 +1,71 @@
+import json
+import os
+import zlib
+from pathlib import Path
+from typing import Any, List
+
+from docling.chunking import DocChunk
+from docling_core.types.doc import DoclingDocument
+from pydantic import TypeAdapter
+
+# zlib streams start with 0x78 ("x"), which a JSON document never does
+_ZLIB_HEADER = b"\x78"
+
+_CHUNK_LIST = TypeAdapter(List[DocChunk])
+
+
+def dumps(obj: Any, compress: bool = True, level: int = 1) -> bytes:
+    """Encodes JSON-compatible data as compact JSON, optionally zlib-compressed.
+
+    Args:
+        obj: Dicts, lists, strings, numbers, booleans and None
+        compress: Compress the encoded bytes with zlib
+        level: zlib compression level; low levels are fast and already shrink
+            the repetitive keys of docling exports a lot
+
+    Returns:
+        The serialized bytes
+    """
+    encoded = json.dumps(obj, separators=(",", ":")).encode("utf-8")
+    return zlib.compress(encoded, level) if compress else encoded
+
+
+def to_json(data: bytes) -> bytes:
+    """Returns the JSON bytes of data written by `dumps`, decompressing if needed."""
+    return zlib.decompress(data) if data[:1] == _ZLIB_HEADER else data
+
+
+def loads(data: bytes) -> Any:
+    """Decodes bytes written by `dumps`."""
+    return json.loads(to_json(data))
+
+
+def dump_document(document: DoclingDocument, compress: bool = True) -> bytes:
+    """Serializes a converted document to its (compressed) JSON export."""
+    return dumps(document.export_to_dict(), compress=compress)
+
+
+def load_document(data: bytes) -> DoclingDocument:
+    """Loads a document serialized with `dump_document` or saved as docling JSON.
+
+    The JSON is parsed and validated in one pass by pydantic, without building
+    an intermediate dict.
+    """
+    return DoclingDocument.model_validate_json(to_json(data))
+
+
+def dump_chunks(chunks: List[DocChunk], compress: bool = True) -> bytes:
+    """Serializes a list of chunks, e.g. the output of HybridChunker, to (compressed) JSON."""
+    return dumps([chunk.export_json_dict() for chunk in chunks], compress=compress)
+
+
+def load_chunks(data: bytes) -> List[DocChunk]:
+    """Loads chunks serialized with `dump_chunks`."""
+    return _CHUNK_LIST.validate_json(to_json(data))
+
+
+def write_atomic(path: Path, data: bytes):
+    """Writes a file via a temporary file, so readers never see a partial write."""
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
@@ -1,58 +1,276 @@
+import asyncio
+import queue
+import threading
 import xml.etree.ElementTree as ET
-from typing import List
+import zlib
+from typing import AsyncIterator, Iterator, List, NamedTuple, Optional
 from urllib.parse import urljoin
 
-import requests
+import httpx
 
+from utils.fetch import Fetcher, get_fetcher
 
-def get_sitemap_urls(base_url: str, sitemap_filename: str = "sitemap.xml") -> List[str]:
-    """Fetches and parses a sitemap XML file to extract URLs.
+_DONE = object()
+_GZIP_MAGIC = b"\x1f\x8b"
+
+
+class SitemapEntry(NamedTuple):
+    """A page (or child sitemap) listed in a sitemap."""
+
+    loc: str
+    lastmod: Optional[str] = None
+
+
+def _local_name(tag: str) -> str:
+    """Strips the XML namespace from a tag name."""
+    return tag.rsplit("}", 1)[-1]
+
+
+class _StreamParser:
+    """Incremental sitemap parser that only keeps the current entry in memory.
+
+    Bytes are fed as they arrive. Gzipped bodies (.xml.gz served without a
+    Content-Encoding header) are recognised by their signature and decompressed
+    on the fly.
+    """
+
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._decompressor = None
+        self._started = False
+        self._depth = 0
+        self._loc: Optional[str] = None
+        self._lastmod: Optional[str] = None
+        self.root: Optional[ET.Element] = None
+
+    @property
+    def is_index(self) -> bool:
+        return self.root is not None and _local_name(self.root.tag) == "sitemapindex"
+
+    def feed(self, data: bytes) -> List[SitemapEntry]:
+        """Parses the next part of the body and returns the entries it completed."""
+        if not self._started and data:
+            self._started = True
+            if data.startswith(_GZIP_MAGIC):
+                self._decompressor = zlib.decompressobj(wbits=31)
+        if self._decompressor is not None:
+            data = self._decompressor.decompress(data)
+        self._parser.feed(data)
+        return self._entries()
+
+    def close(self) -> List[SitemapEntry]:
+        """Finishes parsing and returns the remaining entries."""
+        if self._decompressor is not None:
+            self._parser.feed(self._decompressor.flush())
+        self._parser.close()
+        return self._entries()
+
+    def _entries(self) -> List[SitemapEntry]:
+        entries = []
+        for event, elem in self._parser.read_events():
+            if event == "start":
+                self._depth += 1
+                if self.root is None:
+                    self.root = elem
+                continue
+            # <urlset>/<sitemapindex> -> <url>/<sitemap> -> <loc>/<lastmod>;
+            # deeper tags such as <image:loc> are ignored
+            name = _local_name(elem.tag)
+            if self._depth == 3 and name == "loc":
+                self._loc = (elem.text or "").strip()
+            elif self._depth == 3 and name == "lastmod":
+                self._lastmod = (elem.text or "").strip() or None
+            elif self._depth == 2:
+                if self._loc:
+                    entries.append(SitemapEntry(self._loc, self._lastmod))
+                self._loc = self._lastmod = None
+                # Drop the finished entry so the tree never grows
+                self.root.clear()
+            self._depth -= 1
+        return entries
+
+
+async def crawl_sitemap(
+    sitemap_url: str,
+    fetcher: Fetcher,
+    max_concurrency: int = 16,
+    max_pending: int = 1000,
+) -> AsyncIterator[SitemapEntry]:
+    """Crawls a sitemap and all sitemaps it references, yielding pages as found.
+
+    Sitemap indexes are expanded recursively, with up to `max_concurrency` child
+    sitemaps fetched at once, within the fetcher's per-host limits. Each body is
+    parsed while it downloads, so memory stays flat even for 50 MB sitemaps.
+
+    Args:
+        sitemap_url: URL of the root sitemap or sitemap index
+        fetcher: Shared fetch layer (pooled connections, per-host limits, retries)
+        max_concurrency: Maximum number of sitemaps fetched concurrently
+        max_pending: Maximum number of parsed entries waiting for the consumer
+
+    Yields:
+        (loc, lastmod) entries of the pages, in the order they are found
+
+    Raises:
+        httpx.HTTPError: If a sitemap could not be fetched
+        ET.ParseError: If a sitemap is not valid XML
+    """
+    sitemaps: asyncio.Queue = asyncio.Queue()
+    entries: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+    seen = {sitemap_url}
+    await sitemaps.put(sitemap_url)
+
+    async def handle(parser: _StreamParser, found: List[SitemapEntry]):
+        for entry in found:
+            if not parser.is_index:
+                await entries.put(entry)
+            elif entry.loc not in seen:
+                seen.add(entry.loc)
+                await sitemaps.put(entry.loc)
+
+    async def worker():
+        while True:
+            url = await sitemaps.get()
+            try:
+                async with fetcher.astream(url) as response:
+                    response.raise_for_status()
+                    parser = _StreamParser()
+                    async for data in response.aiter_bytes():
+                        await handle(parser, parser.feed(data))
+                    await handle(parser, parser.close())
+            except Exception as e:
+                await entries.put(e)
+            finally:
+                sitemaps.task_done()
+
+    workers = [asyncio.create_task(worker()) for _ in range(max_concurrency)]
+
+    async def close_when_done():
+        await sitemaps.join()
+        await entries.put(_DONE)
+
+    closer = asyncio.create_task(close_when_done())
+    try:
+        while (item := await entries.get()) is not _DONE:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        closer.cancel()
+        for task in workers:
+            task.cancel()
+
+
+def iter_sitemap_entries(
+    base_url: str,
+    sitemap_filename: str = "sitemap.xml",
+    max_concurrency: int = 16,
+    fetcher: Optional[Fetcher] = None,
+) -> Iterator[SitemapEntry]:
+    """Yields (loc, lastmod) for the pages of a site's sitemap while it is crawled.
+
+    The crawl runs on an event loop in a background thread, so this works from
+    plain scripts and notebooks alike, and callers can start processing the
+    first URLs while further sitemaps are downloaded.
 
     Args:
         base_url: The base URL of the website
         sitemap_filename: The filename of the sitemap (default: sitemap.xml)
+        max_concurrency: Maximum number of sitemaps fetched concurrently
+        fetcher: Fetch layer to use (default: the shared process-wide fetcher)
 
-    Returns:
-        List of URLs found in the sitemap. If sitemap is not found, returns a list
-        containing only the base URL.
+    Yields:
+        (loc, lastmod) entries found in the sitemap; lastmod is None when the
+        sitemap does not list it. If the sitemap is not found, only the base URL
+        is yielded.
 
     Raises:
         ValueError: If there's an error fetching (except 404) or parsing the sitemap
     """
+    sitemap_url = urljoin(base_url, sitemap_filename)
+    fetcher = fetcher or get_fetcher()
+    found: queue.Queue = queue.Queue(maxsize=10_000)
+    stop = threading.Event()
+
+    async def produce():
+        try:
+            async for entry in crawl_sitemap(sitemap_url, fetcher, max_concurrency):
+                if stop.is_set():
+                    break
+                await asyncio.to_thread(found.put, entry)
+        except httpx.HTTPStatusError as e:
+            # Return just the base URL if sitemap not found
+            not_found = e.response.status_code == 404
+            if not_found and e.request.url == httpx.URL(sitemap_url):
+                found.put(SitemapEntry(base_url.rstrip("/")))
+            else:
+                found.put(e)
+        except Exception as e:
+            found.put(e)
+        finally:
+            # The connections belong to this thread's event loop
+            await fetcher.aclose()
+        found.put(_DONE)
+
+    thread = threading.Thread(target=asyncio.run, args=(produce(),), daemon=True)
+    thread.start()
     try:
-        sitemap_url = urljoin(base_url, sitemap_filename)
+        while (item := found.get()) is not _DONE:
+            if isinstance(item, httpx.HTTPError):
+                raise ValueError(f"Failed to fetch sitemap: {str(item)}")
+            if isinstance(item, ET.ParseError):
+                raise ValueError(f"Failed to parse sitemap XML: {str(item)}")
+            if isinstance(item, Exception):
+                raise ValueError(f"Unexpected error processing sitemap: {str(item)}")
+            yield item
+    finally:
+        # If the caller stopped early, let the producer finish its pending put
+        # and see the stop flag
+        stop.set()
+        while not found.empty():
+            found.get_nowait()
 
-        # Fetch sitemap URL
-        response = requests.get(sitemap_url, timeout=10)
 
-        # # Return just the base URL if sitemap not found
-        if response.status_code == 404:
-            return [base_url.rstrip("/")]
+def iter_sitemap_urls(
+    base_url: str,
+    sitemap_filename: str = "sitemap.xml",
+    max_concurrency: int = 16,
+    fetcher: Optional[Fetcher] = None,
+) -> Iterator[str]:
+    """Yields the page URLs of a site's sitemap while it is still being crawled.
+
+    See `iter_sitemap_entries`, which also yields each page's lastmod.
+    """
+    for entry in iter_sitemap_entries(
+        base_url, sitemap_filename, max_concurrency, fetcher
+    ):
+        yield entry.loc
 
-        response.raise_for_status()
 
-        # Parse XML content
-        root = ET.fromstring(response.content)
+def get_sitemap_urls(
+    base_url: str,
+    sitemap_filename: str = "sitemap.xml",
+    max_concurrency: int = 16,
+) -> List[str]:
+    """Fetches and parses a sitemap XML file to extract URLs.
 
-        # Handle different XML namespaces that sitemaps might use
-        namespaces = (
-            {"ns": root.tag.split("}")[0].strip("{")} if "}" in root.tag else ""
-        )
+    Sitemap indexes are expanded recursively and gzipped sitemaps are supported.
+    Use `iter_sitemap_entries` to process (loc, lastmod) pairs as they stream in
+    instead of waiting for the whole list.
 
-        # Extract URLs using namespace if present
-        if namespaces:
-            urls = [elem.text for elem in root.findall(".//ns:loc", namespaces)]
-        else:
-            urls = [elem.text for elem in root.findall(".//loc")]
+    Args:
+        base_url: The base URL of the website
+        sitemap_filename: The filename of the sitemap (default: sitemap.xml)
+        max_concurrency: Maximum number of sitemaps fetched concurrently
 
-        return urls
+    Returns:
+        List of URLs found in the sitemap. If sitemap is not found, returns a list
+        containing only the base URL.
 
-    except requests.RequestException as e:
-        raise ValueError(f"Failed to fetch sitemap: {str(e)}")
-    except ET.ParseError as e:
-        raise ValueError(f"Failed to parse sitemap XML: {str(e)}")
-    except Exception as e:
-        raise ValueError(f"Unexpected error processing sitemap: {str(e)}")
+    Raises:
+        ValueError: If there's an error fetching (except 404) or parsing the sitemap
+    """
+    return list(iter_sitemap_urls(base_url, sitemap_filename, max_concurrency))
 
 
 if __name__ == "__main__":
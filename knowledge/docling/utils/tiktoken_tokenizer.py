@@ -0,0 +1,85 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+import tiktoken
+from docling_core.transforms.chunker.tokenizer.base import BaseTokenizer
+from pydantic import PrivateAttr
+
+# Process-wide registry of loaded encodings, filled on first use
+_encodings: Dict[str, tiktoken.Encoding] = {}
+_encodings_lock = threading.Lock()
+
+
+def get_encoding(name: str) -> tiktoken.Encoding:
+    """Returns a tiktoken encoding, loading it once per process."""
+    encoding = _encodings.get(name)
+    if encoding is None:
+        with _encodings_lock:
+            encoding = _encodings.get(name)
+            if encoding is None:
+                encoding = _encodings[name] = tiktoken.get_encoding(name)
+    return encoding
+
+
+class TiktokenTokenizer(BaseTokenizer):
+    """tiktoken adapter for HybridChunker with integer, memoized token counts.
+
+    HybridChunker re-counts the same spans when merging peers, so counts are
+    kept in a per-instance LRU keyed by a 16-byte digest of the text: memory
+    stays bounded and the chunk texts are not retained. Only the settings are
+    pickled into worker processes, which load the encoding lazily on first
+    use and start with an empty cache.
+    """
+
+    encoding_name: str = "cl100k_base"
+    max_tokens: int = 8191  # text-embedding-3-large's maximum context length
+    count_cache_size: int = 65536
+
+    _counts: "OrderedDict[bytes, int]" = PrivateAttr(default_factory=OrderedDict)
+
+    def __getstate__(self) -> Dict[Any, Any]:
+        state = super().__getstate__()
+        state["__pydantic_private__"] = {"_counts": OrderedDict()}
+        return state
+
+    @property
+    def encoding(self) -> tiktoken.Encoding:
+        return get_encoding(self.encoding_name)
+
+    def count_tokens(self, text: str) -> int:
+        """Get number of tokens for given text."""
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        count = self._counts.pop(key, None)
+        if count is None:
+            count = len(self.encoding.encode_ordinary(text))
+        self._counts[key] = count  # (Re)inserted as the most recently used
+        if len(self._counts) > self.count_cache_size:
+            self._counts.popitem(last=False)
+        return count
+
+    def count_tokens_batch(self, texts: List[str], num_threads: int = 8) -> List[int]:
+        """Counts tokens for many texts, encoding them in parallel threads.
+
+        Args:
+            texts: Texts to count
+            num_threads: Threads used by tiktoken's batch encoder
+
+        Returns:
+            Token count per text
+        """
+        encoded = self.encoding.encode_ordinary_batch(texts, num_threads=num_threads)
+        return [len(ids) for ids in encoded]
+
+    def get_max_tokens(self) -> int:
+        """Get maximum number of tokens allowed."""
+        return self.max_tokens
+
+    def get_tokenizer(self) -> tiktoken.Encoding:
+        """Get underlying tokenizer object."""
+        return self.encoding
+
+    def tokenize(self, text: str, **kwargs) -> List[str]:
+        """Token ids as strings, for callers of the HuggingFace-style interface."""
+        return [str(t) for t in self.encoding.encode_ordinary(text)]
@@ -1,4 +1,4 @@
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from tiktoken import get_encoding
 from transformers.tokenization_utils_base import PreTrainedTokenizerBase
@@ -20,6 +20,7 @@ class OpenAITokenizerWrapper(PreTrainedTokenizerBase):
         super().__init__(model_max_length=max_length, **kwargs)
         self.tokenizer = get_encoding(model_name)
         self._vocab_size = self.tokenizer.max_token_value
+        self._vocab: Optional[Dict[str, int]] = None
 
     def tokenize(self, text: str, **kwargs) -> List[str]:
         """Main method used by HybridChunker."""
@@ -35,7 +36,9 @@ class OpenAITokenizerWrapper(PreTrainedTokenizerBase):
         return str(index)
 
     def get_vocab(self) -> Dict[str, int]:
-        return dict(enumerate(range(self.vocab_size)))
+        if self._vocab is None:
+            self._vocab = dict(enumerate(range(self.vocab_size)))
+        return self._vocab
 
     @property
     def vocab_size(self) -> int: